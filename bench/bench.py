@@ -0,0 +1,195 @@
+# -*- encoding: utf-8 -*-
+
+import cProfile
+import json
+import optparse
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'plugin'))
+
+import server
+
+vitra = None
+
+
+def load_plugin(port, cache_dir, options):
+    global vitra
+    start = time.time()
+    import vitra
+    loaded = time.time()
+    vitra.vim.load_defaults(os.path.join(ROOT, 'plugin', 'vitra.vim'))
+    vitra.vim.vars.update({
+        'tracServerList': {
+            'bench': {
+                'server': '127.0.0.1:{0}'.format(port),
+                'auth': 'bench:bench',
+            },
+        },
+        'tracDefaultServer': 'bench',
+        'tracCacheDir': cache_dir,
+        'tracPrefetchWorkers': 0,
+        'tracMirror': 1 if options.mirror else 0,
+    })
+    vitra.trac_init()
+    return loaded - start, time.time() - loaded
+
+
+def scenarios():
+    trac = vitra.trac
+    tid = trac.ticket.query_string()
+    tid = trac.server.ticket.query(tid)[0]
+
+    def fields():
+        trac.ticket.load_settings()
+        trac.ticket.get_fields()
+
+    def comment():
+        trac.uiticket.windows['edit'].content = u'Benchmark comment'
+        trac.update_ticket('comment')
+
+    def save():
+        trac.uiwiki.windows['wiki'].content = u'= Benchmark =\n\nEdited.'
+        trac.save_wiki(u'Benchmark edit')
+
+    def report():
+        vitra.vim.vars['tracTicketClause'] = u'status!=closed&max=0'
+        fields()
+
+    return [
+        ('Ticket.get_all', fields, trac.ticket.get_all),
+        ('Ticket.get', fields, lambda: trac.ticket.get(tid)),
+        ('Wiki.get_all', trac.wiki.load_settings, trac.wiki.get_all),
+        ('Wiki.get', trac.wiki.load_settings,
+         lambda: trac.wiki.get('WikiStart')),
+        ('search', fields,
+         lambda: vitra.search('crash slow', trac.ticket.mirror)),
+        ('Trac.ticket_view', None, lambda: trac.ticket_view(tid)),
+        ('Trac.wiki_view', None, lambda: trac.wiki_view('WikiStart')),
+        ('Trac.update_ticket', lambda: trac.ticket_view(tid), comment),
+        ('Trac.save_wiki', lambda: trac.wiki_view('WikiStart'), save),
+        ('Ticket.get_all max=0', report, trac.ticket.get_all),
+    ]
+
+
+def run(srv, prepare, func, rounds, profile=None):
+    if prepare is not None:
+        prepare()
+    commands = vitra.vim.commands
+    result = []
+    for i in range(rounds):
+        before = srv.snapshot()
+        errors = len(commands)
+        start = time.time()
+        if profile is not None:
+            profile.runcall(func)
+        else:
+            func()
+        elapsed = time.time() - start
+        after = srv.snapshot()
+        result.append({
+            'ms': elapsed * 1000,
+            'requests': after.get('requests', 0) - before.get('requests', 0),
+            'calls': after.get('calls', 0) - before.get('calls', 0),
+            'errors': [c for c in commands[errors:]
+                       if c.startswith('echoerr')],
+        })
+    return result
+
+
+def summarize(name, result):
+    warm = result[1:] or result
+    average = lambda key, runs: sum([r[key] for r in runs]) / len(runs)
+    return {
+        'name': name,
+        'cold_ms': result[0]['ms'],
+        'warm_ms': average('ms', warm),
+        'min_ms': min([r['ms'] for r in result]),
+        'cold_requests': result[0]['requests'],
+        'warm_requests': average('requests', warm) * 1.0,
+        'cold_calls': result[0]['calls'],
+        'warm_calls': average('calls', warm) * 1.0,
+        'errors': sum([r['errors'] for r in result], []),
+    }
+
+
+def report(summaries):
+    rows = [[u'Benchmark', u'Cold ms', u'Warm ms', u'Min ms',
+             u'Round trips', u'Warm trips', u'Calls', u'Warm calls']]
+    for s in summaries:
+        rows.append([s['name'], u'{0:.1f}'.format(s['cold_ms']),
+                     u'{0:.1f}'.format(s['warm_ms']),
+                     u'{0:.1f}'.format(s['min_ms']),
+                     unicode(s['cold_requests']),
+                     u'{0:.1f}'.format(s['warm_requests']),
+                     unicode(s['cold_calls']),
+                     u'{0:.1f}'.format(s['warm_calls'])])
+    for line in vitra.align_columns(rows):
+        print(line)
+    for s in summaries:
+        for error in s['errors']:
+            sys.stderr.write(u'{0}: {1}\n'.format(s['name'], error))
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] [benchmark...]')
+    parser.add_option('-l', '--latency', type='float', default=0,
+                      help='delay in milliseconds added to every request')
+    parser.add_option('-t', '--tickets', type='int', default=100000)
+    parser.add_option('-w', '--pages', type='int', default=10000)
+    parser.add_option('-r', '--rounds', type='int', default=5,
+                      help='runs of each benchmark, the first one is cold')
+    parser.add_option('-m', '--mirror', action='store_true',
+                      help='serve ticket lists from the SQLite mirror')
+    parser.add_option('-j', '--json', metavar='FILE',
+                      help='also write the results to FILE')
+    parser.add_option('-p', '--profile', metavar='FILE',
+                      help='write cProfile statistics of the runs to FILE')
+    options, names = parser.parse_args()
+
+    start = time.time()
+    dataset = server.Dataset(options.tickets, options.pages)
+    srv = server.TracServer(dataset, latency=options.latency / 1000.0)
+    port = srv.start()
+    print('Generated {0} tickets and {1} wiki pages in {2:.1f}s, '
+          'latency {3}ms'.format(options.tickets, options.pages,
+                                 time.time() - start, options.latency))
+
+    cache_dir = tempfile.mkdtemp(prefix='vitra-bench-')
+    try:
+        loading, init = load_plugin(port, cache_dir, options)
+        print('Loaded vitra.py in {0:.1f}ms, trac_init() took {1:.1f}ms'
+              .format(loading * 1000, init * 1000))
+        profile = cProfile.Profile() if options.profile else None
+        summaries = []
+        for name, prepare, func in scenarios():
+            if names and name not in names:
+                continue
+            result = run(srv, prepare, func, max(options.rounds, 1), profile)
+            summaries.append(summarize(name, result))
+        report(summaries)
+        if profile is not None:
+            profile.dump_stats(options.profile)
+        vitra.trac.disconnect()
+        if options.json:
+            with open(options.json, 'w') as fp:
+                json.dump({
+                    'latency': options.latency,
+                    'tickets': options.tickets,
+                    'pages': options.pages,
+                    'rounds': options.rounds,
+                    'results': summaries,
+                    'metrics': vitra.metrics.export(),
+                }, fp, indent=2, sort_keys=True)
+    finally:
+        srv.shutdown()
+        srv.server_close()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
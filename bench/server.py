@@ -0,0 +1,394 @@
+# -*- encoding: utf-8 -*-
+
+import Cookie
+import datetime
+import hashlib
+import os
+import random
+import re
+import SimpleXMLRPCServer
+import SocketServer
+import threading
+import time
+import urllib2
+import xmlrpclib
+
+
+EPOCH = datetime.datetime(2015, 1, 1)
+WORDS = (u'alpha beta gamma delta editor window buffer crash slow render '
+         u'query filter report login cache timeline wiki ticket search '
+         u'attachment milestone import export unicode sync').split()
+FIELDS = [
+    ('summary', 'Summary', 'text', None),
+    ('reporter', 'Reporter', 'text', None),
+    ('owner', 'Owner', 'text', None),
+    ('description', 'Description', 'textarea', None),
+    ('type', 'Type', 'select', ['defect', 'enhancement', 'task']),
+    ('status', 'Status', 'radio',
+     ['new', 'assigned', 'accepted', 'reopened', 'closed']),
+    ('priority', 'Priority', 'select',
+     ['blocker', 'critical', 'major', 'minor', 'trivial']),
+    ('milestone', 'Milestone', 'select',
+     ['milestone{0}'.format(i) for i in range(1, 21)]),
+    ('component', 'Component', 'select',
+     ['component{0}'.format(i) for i in range(1, 41)]),
+    ('version', 'Version', 'select', ['1.0', '1.1', '2.0', '2.1', '3.0']),
+    ('resolution', 'Resolution', 'radio',
+     ['fixed', 'invalid', 'wontfix', 'duplicate', 'worksforme']),
+    ('keywords', 'Keywords', 'text', None),
+    ('cc', 'Cc', 'text', None),
+    ('time', 'Created', 'time', None),
+    ('changetime', 'Modified', 'time', None),
+]
+USERS = ['user{0}'.format(i) for i in range(1, 201)]
+ACTIONS = [
+    ['leave', 'leave', 'The ticket will remain unchanged.', []],
+    ['resolve', 'resolve', 'The resolution will be set.',
+     [['action_resolve_resolve_resolution', 'fixed',
+       ['fixed', 'invalid', 'wontfix', 'duplicate', 'worksforme']]]],
+    ['reassign', 'reassign', 'The owner will be changed.',
+     [['action_reassign_reassign_owner', 'user1', []]]],
+    ['accept', 'accept', 'The owner will be changed to you.', []],
+]
+
+
+class Dataset(object):
+    SELECT = ('type', 'status', 'priority', 'milestone', 'component',
+              'version')
+
+    def __init__(self, tickets=100000, pages=10000, seed=1):
+        rand = random.Random(seed)
+        self.options = options = dict([(f[0], f[3]) for f in FIELDS if f[3]])
+        self.rows = [None]
+        for tid in range(1, tickets + 1):
+            row = dict([(k, rand.choice(options[k])) for k in self.SELECT])
+            row['owner'] = rand.choice(USERS)
+            row['reporter'] = rand.choice(USERS)
+            row['changed'] = EPOCH + datetime.timedelta(minutes=tid * 5)
+            self.rows.append(row)
+        self.pages = dict([(self.page_name(i), 1) for i in range(pages)])
+        self.page_changes = {}
+        self.attachments = {}
+        self.lock = threading.Lock()
+
+    def page_name(self, i):
+        if i == 0:
+            return 'WikiStart'
+        return u'{0}{1}Page{2}'.format(WORDS[i % len(WORDS)].title(),
+                                       WORDS[i // 7 % len(WORDS)].title(), i)
+
+    def words(self, seed, count):
+        rand = random.Random(seed)
+        return u' '.join([rand.choice(WORDS) for i in range(count)])
+
+    def get(self, tid):
+        row = self.rows[tid]
+        created = EPOCH + datetime.timedelta(minutes=tid)
+        changed = xmlrpclib.DateTime(row['changed'])
+        attrs = dict([(k, row[k]) for k in self.SELECT])
+        attrs.update({
+            'summary': row.get('summary') or self.words(tid, 8),
+            'description': row.get('description') or
+            u'\n'.join([self.words(tid * 31 + i, 16) for i in range(10)]),
+            'owner': row['owner'],
+            'reporter': row['reporter'],
+            'resolution': 'fixed' if row['status'] == 'closed' else '',
+            'keywords': self.words(tid * 7, 2),
+            'cc': '',
+            'time': xmlrpclib.DateTime(created),
+            'changetime': changed,
+            '_ts': str(row['changed']),
+        })
+        return [tid, xmlrpclib.DateTime(created), changed, attrs]
+
+    def changelog(self, tid):
+        row = self.rows[tid]
+        result = []
+        for i in range(tid % 6):
+            when = xmlrpclib.DateTime(EPOCH + datetime.timedelta(
+                minutes=tid, hours=i + 1))
+            result.append([when, row['reporter'], 'comment', str(i + 1),
+                           self.words(tid * 13 + i, 30), 1])
+        if row['status'] != 'new':
+            result.append([xmlrpclib.DateTime(row['changed']), row['owner'],
+                           'status', 'new', row['status'], 1])
+        return result
+
+    def matches(self, row, key, op, values):
+        value = row.get(key, '')
+        if op == '=':
+            return value in values
+        if op == '!=':
+            return value not in values
+        if op == '~=':
+            return any([v in value for v in values])
+        return True
+
+    def query(self, qstr='status!=closed'):
+        clauses, options = [], {}
+        for part in qstr.split('&'):
+            m = re.match(r'^(\w+)(!=|~=|=)(.*)$', part)
+            if not m:
+                continue
+            key, op, value = m.groups()
+            if key in ('order', 'group', 'max', 'page', 'desc', 'col'):
+                options[key] = value
+            elif key == 'id':
+                continue
+            else:
+                clauses.append((key, op, value.split('|')))
+        ids = [tid for tid in range(1, len(self.rows))
+               if all([self.matches(self.rows[tid], *c) for c in clauses])]
+        keys = [options.get('group'), options.get('order', 'id')]
+        keys = [k for k in keys if k and k not in ('id', 'None')]
+        if keys:
+            ids.sort(key=lambda t: [self.rows[t].get(k) for k in keys])
+        if options.get('desc') == '1':
+            ids.reverse()
+        per_page = int(options.get('max') or 100)
+        if per_page:
+            page = int(options.get('page') or 1)
+            ids = ids[(page - 1) * per_page:page * per_page]
+        return ids
+
+    def recent_changes(self, since):
+        since = datetime.datetime.strptime(since.value, '%Y%m%dT%H:%M:%S')
+        return [tid for tid in range(1, len(self.rows))
+                if self.rows[tid]['changed'] > since]
+
+    def update(self, tid, comment, attrs, notify=False, *args):
+        with self.lock:
+            row = self.rows[tid]
+            for key, value in attrs.items():
+                if key in row or key in ('summary', 'description'):
+                    row[key] = value
+            row['changed'] = datetime.datetime.utcnow()
+        return self.get(tid)
+
+    def create(self, summary, description, attrs, notify=False):
+        with self.lock:
+            row = dict([(k, self.options[k][0]) for k in self.SELECT])
+            row.update({'owner': USERS[0], 'reporter': USERS[0],
+                        'summary': summary, 'description': description,
+                        'changed': datetime.datetime.utcnow()})
+            row.update([(k, v) for k, v in attrs.items() if k in row])
+            self.rows.append(row)
+            return len(self.rows) - 1
+
+    def put_attachment(self, tid, filename, description, data, replace=True):
+        with self.lock:
+            self.attachments[(tid, filename)] = data.data
+        return filename
+
+    def get_attachment(self, tid, filename):
+        return xmlrpclib.Binary(self.attachments[(tid, filename)])
+
+    def page_info(self, name, version=None):
+        if name not in self.pages:
+            raise xmlrpclib.Fault(404, u'Wiki page "{0}" does not exist'
+                                       .format(name))
+        changed = self.page_changes.get(name, EPOCH)
+        return {
+            'name': name,
+            'version': self.pages[name],
+            'lastModified': xmlrpclib.DateTime(changed),
+            'author': USERS[hash(name) % len(USERS)],
+            'comment': '',
+        }
+
+    def page(self, name, version=None):
+        self.page_info(name)
+        lines = [u'= {0} ='.format(name), u'', u'[[PageOutline]]', u'']
+        for i in range(20):
+            lines.extend([u'== Section {0} =='.format(i), u'',
+                          self.words(u'{0}{1}'.format(name, i), 60),
+                          u' * See [wiki:WikiStart] and #{0}'.format(i + 1),
+                          u'', u"'''bold''' ''italic'' {{{code}}}", u''])
+        return u'\n'.join(lines)
+
+    def page_html(self, name, version=None):
+        return u'<pre>{0}</pre>'.format(self.page(name, version))
+
+    def put_page(self, name, text, attrs):
+        with self.lock:
+            self.pages[name] = self.pages.get(name, 0) + 1
+            self.page_changes[name] = datetime.datetime.utcnow()
+        return True
+
+    def recent_pages(self, since):
+        since = datetime.datetime.strptime(since.value, '%Y%m%dT%H:%M:%S')
+        return [self.page_info(n) for n, t in self.page_changes.items()
+                if t > since]
+
+    def search(self, query, filters=None):
+        terms = query.lower().split()
+        result = []
+        for name in sorted(self.pages):
+            if all([t in name.lower() for t in terms]):
+                result.append([u'/wiki/{0}'.format(name), name,
+                               xmlrpclib.DateTime(EPOCH), USERS[0], name])
+        for tid in range(1, len(self.rows)):
+            summary = self.rows[tid].get('summary') or self.words(tid, 8)
+            if all([t in summary for t in terms]):
+                result.append([u'/ticket/{0}'.format(tid), summary,
+                               xmlrpclib.DateTime(self.rows[tid]['changed']),
+                               self.rows[tid]['reporter'], summary])
+            if len(result) >= 1000:
+                break
+        return result
+
+
+class RequestHandler(SimpleXMLRPCServer.SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/login/rpc', '/rpc')
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        SimpleXMLRPCServer.SimpleXMLRPCRequestHandler.setup(self)
+        self.server.count('connections')
+
+    def do_POST(self):
+        self.server.count('requests')
+        self.session = None
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if not self.server.authorize(self):
+            self.rfile.read(int(self.headers.get('content-length', 0)))
+            body = 'Authorization required'
+            self.send_response(401)
+            self.send_header('WWW-Authenticate', 'Digest realm="{0}", '
+                             'nonce="{1}", qop="auth"'.format(
+                                 self.server.digest[0], self.server.nonce))
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        SimpleXMLRPCServer.SimpleXMLRPCRequestHandler.do_POST(self)
+
+    def end_headers(self):
+        if self.session:
+            self.send_header('Set-Cookie',
+                             'trac_auth={0}; Path=/'.format(self.session))
+        SimpleXMLRPCServer.SimpleXMLRPCRequestHandler.end_headers(self)
+
+
+class TracServer(SocketServer.ThreadingMixIn,
+                 SimpleXMLRPCServer.SimpleXMLRPCServer):
+    daemon_threads = True
+
+    def __init__(self, dataset, port=0, latency=0, digest=None):
+        SimpleXMLRPCServer.SimpleXMLRPCServer.__init__(
+            self, ('127.0.0.1', port), RequestHandler, logRequests=False,
+            allow_none=True)
+        self.dataset = dataset
+        self.latency = latency
+        self.digest = digest
+        self.nonce = hashlib.md5(os.urandom(8)).hexdigest()
+        self.sessions = set()
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.register_multicall_functions()
+        self.register_introspection_functions()
+
+        fields = [dict([('name', n), ('label', l), ('type', t)] +
+                       ([('options', o)] if o else []))
+                  for n, l, t, o in FIELDS]
+        for name, method in [
+                ('ticket.query', dataset.query),
+                ('ticket.get', dataset.get),
+                ('ticket.changeLog', dataset.changelog),
+                ('ticket.listAttachments', lambda tid: []),
+                ('ticket.putAttachment', dataset.put_attachment),
+                ('ticket.getAttachment', dataset.get_attachment),
+                ('ticket.getActions', lambda tid: ACTIONS),
+                ('ticket.getTicketFields', lambda: fields),
+                ('ticket.getRecentChanges', dataset.recent_changes),
+                ('ticket.update', dataset.update),
+                ('ticket.create', dataset.create),
+                ('wiki.getAllPages', lambda: sorted(dataset.pages)),
+                ('wiki.getPage', dataset.page),
+                ('wiki.getPageInfo', dataset.page_info),
+                ('wiki.getPageHTML', dataset.page_html),
+                ('wiki.listAttachments', lambda name: []),
+                ('wiki.getRecentChanges', dataset.recent_pages),
+                ('wiki.putPage', dataset.put_page),
+                ('wiki.wikiToHtml', lambda text: u'<pre>{0}</pre>'
+                                                 .format(text)),
+                ('search.performSearch', dataset.search),
+                ('search.getSearchFilters',
+                 lambda: [['ticket', 'Tickets'], ['wiki', 'Wiki']])]:
+            self.register_function(self.counted(name, method), name)
+
+    def authorize(self, handler):
+        if not self.digest:
+            return True
+        cookie = Cookie.SimpleCookie()
+        try:
+            cookie.load(handler.headers.get('cookie', ''))
+        except Cookie.CookieError:
+            pass
+        if 'trac_auth' in cookie and cookie['trac_auth'].value in \
+                self.sessions:
+            self.count('cookie')
+            return True
+        m = re.match(r'Digest\s+(.*)', handler.headers.get('authorization',
+                                                           ''), re.I)
+        if not m:
+            self.count('challenge')
+            return False
+        values = urllib2.parse_keqv_list(urllib2.parse_http_list(m.group(1)))
+        realm, user, password = self.digest
+        md5 = lambda *parts: hashlib.md5(':'.join(parts)).hexdigest()
+        ha1 = md5(user, realm, password)
+        ha2 = md5(handler.command, values.get('uri', ''))
+        if values.get('qop') == 'auth':
+            expected = md5(ha1, self.nonce, values.get('nc', ''),
+                           values.get('cnonce', ''), 'auth', ha2)
+        else:
+            expected = md5(ha1, self.nonce, ha2)
+        if values.get('username') != user or \
+                values.get('response') != expected:
+            self.count('challenge')
+            return False
+        self.count('digest')
+        handler.session = hashlib.md5(os.urandom(8)).hexdigest()
+        with self.lock:
+            self.sessions.add(handler.session)
+        return True
+
+    def counted(self, name, method):
+        def wrapper(*args):
+            self.count('calls')
+            self.count(name)
+            return method(*args)
+        return wrapper
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.server_address[1]
+
+
+if __name__ == '__main__':
+    import optparse
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-p', '--port', type='int', default=8000)
+    parser.add_option('-l', '--latency', type='float', default=0,
+                      help='delay in milliseconds added to every request')
+    parser.add_option('-t', '--tickets', type='int', default=100000)
+    parser.add_option('-w', '--pages', type='int', default=10000)
+    options, args = parser.parse_args()
+    server = TracServer(Dataset(options.tickets, options.pages),
+                        options.port, options.latency / 1000.0)
+    print('Serving {0} tickets and {1} wiki pages on '
+          'http://127.0.0.1:{2}/login/rpc'.format(
+              options.tickets, options.pages, options.port))
+    server.serve_forever()
@@ -1,21 +1,206 @@
 # -*- encoding: utf-8 -*-
 
+import ast
+import base64
+import bisect
+import cgi
 import codecs
+import collections
+import contextlib
+import Cookie
 import datetime
+import errno
+import functools
+import hashlib
+import htmlentitydefs
+import itertools
+import HTMLParser
+import httplib
+import json
 import os.path
+import pickle
+import Queue
 import re
+import socket
+import sqlite3
+import tempfile
+import textwrap
+import threading
+import time
+import unicodedata
+import urllib
 import urllib2
-import vim
+import urlparse
 import webbrowser
 import xmlrpclib
 
 
 trac = None
 
+SYNC_MARGIN = datetime.timedelta(minutes=5)
+PREFETCH_WINDOW = 300
+
+
+def is_main_thread():
+    return threading.current_thread().name == 'MainThread'
+
+
+class HeadlessVim(object):
+    class error(Exception):
+        pass
+
+    class Buffer(list):
+        def __init__(self, name, number):
+            super(HeadlessVim.Buffer, self).__init__()
+            self.name = name
+            self.number = number
+
+        def __eq__(self, other):
+            return self is other
+
+        def __ne__(self, other):
+            return self is not other
+
+        __hash__ = object.__hash__
+
+        def append(self, lines):
+            if isinstance(lines, list):
+                self.extend(lines)
+            else:
+                super(HeadlessVim.Buffer, self).append(lines)
+
+    class Current(object):
+        def __init__(self, buffer):
+            self.buffer = buffer
+            self.line = ''
+
+    def __init__(self):
+        self.vars = {}
+        self.options = {'encoding': 'utf-8', 'columns': 80, 'lines': 24}
+        self.commands = []
+        self.last = 1
+        self.buffers = [self.Buffer('', self.last)]
+        self.windows = list(self.buffers)
+        self.current = self.Current(self.buffers[0])
+
+    def load_defaults(self, file_name):
+        with open(file_name) as fp:
+            script = fp.read()
+        for name, value in re.findall(r"s:vitraDefault\('g:(\w+)', (.*)\)",
+                                      script):
+            if value.startswith('expand('):
+                value = os.path.expanduser(ast.literal_eval(value[7:-1]))
+            elif value == '{}':
+                value = {}
+            else:
+                value = ast.literal_eval(value)
+            self.vars.setdefault(name, value)
+
+    def to_vim(self, value):
+        if isinstance(value, (list, tuple)):
+            return [self.to_vim(v) for v in value]
+        if isinstance(value, dict):
+            return dict([(k, self.to_vim(v)) for k, v in value.items()])
+        if isinstance(value, unicode):
+            return value.encode(self.options['encoding'])
+        return str(value)
+
+    def unescape(self, name):
+        return re.sub(r'\\(.)', r'\1', name)
+
+    def find(self, name, buffers):
+        for nr, buf in enumerate(buffers):
+            if buf.name == name:
+                return nr + 1
+        return -1
+
+    def eval(self, expr):
+        m = re.match(r'^(?:g:)?(&?)(\w+)$', expr)
+        if m:
+            scope = self.options if m.group(1) else self.vars
+            if m.group(2) not in scope:
+                raise self.error(u'E121: Undefined variable: {0}'.format(
+                    expr))
+            return self.to_vim(scope[m.group(2)])
+        m = re.match(r'^(\w+)\("((?:[^"\\]|\\.)*)"(?:, "(.*)")?', expr)
+        name, arg, extra = m.groups() if m else (None, None, None)
+        if name == 'escape':
+            return re.sub(u'([{0}])'.format(re.escape(extra)), r'\\\1',
+                          self.unescape(arg))
+        if name == 'bufwinnr':
+            return str(self.find(self.unescape(arg), self.windows))
+        if name in ('winwidth', 'winheight'):
+            key = 'columns' if name == 'winwidth' else 'lines'
+            return str(self.options[key])
+        if name == 'expand' and arg == '%':
+            return self.current.buffer.name
+        if name == 'confirm':
+            return '1'
+        return '0'
+
+    def command(self, cmd):
+        self.commands.append(cmd)
+        m = re.match(r'^call VitraBatch\(\[(.*)\]\)$', cmd, re.S)
+        if m:
+            for c in re.findall(r"'((?:[^']|'')*)'", m.group(1)):
+                self.command(c.replace("''", "'"))
+            return
+        cmd = re.sub(r'^silent!? ', '', cmd)
+        m = re.match(r'^(?:[\w ]* )?new (.*)$', cmd)
+        if m:
+            name = self.unescape(m.group(1))
+            nr = self.find(name, self.buffers)
+            if nr > 0:
+                buf = self.buffers[nr - 1]
+            else:
+                self.last += 1
+                buf = self.Buffer(name, self.last)
+                self.buffers.append(buf)
+            if buf not in self.windows:
+                self.windows.append(buf)
+            self.current = self.Current(buf)
+            return
+        m = re.match(r'^(\d+)wincmd w$', cmd)
+        if m and 0 < int(m.group(1)) <= len(self.windows):
+            self.current = self.Current(self.windows[int(m.group(1)) - 1])
+            return
+        m = re.match(r'^f (.*)$', cmd)
+        if m:
+            self.current.buffer.name = self.unescape(m.group(1))
+            return
+        m = re.match(r'^bdelete (.*)$', cmd)
+        if m:
+            nr = self.find(self.unescape(m.group(1)), self.buffers)
+            if nr > 0:
+                buf = self.buffers.pop(nr - 1)
+                if buf in self.windows:
+                    self.windows.remove(buf)
+            return
+        if cmd == 'only':
+            self.windows = [self.current.buffer]
+            return
+        m = re.match(r'^let g:(\w+)\s*=\s*(.*)$', cmd, re.S)
+        if m:
+            try:
+                self.vars[m.group(1)] = ast.literal_eval(m.group(2))
+            except (SyntaxError, ValueError):
+                self.vars[m.group(1)] = m.group(2)
+
+
+try:
+    import vim
+except ImportError:
+    vim = HeadlessVim()
+
 
 class Vim(object):
     _encoding = vim.eval("&encoding")
 
+    def __init__(self):
+        self.deferred = []
+        self.pending = None
+        self.crossings = 0
+
     def decode(self, value):
         decode = self.decode
 
@@ -41,11 +226,49 @@ class Vim(object):
         return value
 
     def eval(self, expr):
+        self.send()
+        self.crossings += 1
         return self.decode(vim.eval(self.encode(expr)))
 
     def command(self, cmd):
+        if not is_main_thread():
+            self.deferred.append(cmd)
+            return
+        if self.pending is not None:
+            if '\n' not in cmd:
+                self.pending.append(self.encode(cmd))
+                return
+            self.send()
+        self.crossings += 1
         vim.command(self.encode(cmd))
 
+    @contextlib.contextmanager
+    def batch(self):
+        if self.pending is not None:
+            yield
+            return
+        self.pending = []
+        try:
+            yield
+        finally:
+            self.send()
+            self.pending = None
+
+    def send(self):
+        if not self.pending:
+            return
+        cmds, self.pending = self.pending, []
+        self.crossings += 1
+        if len(cmds) == 1:
+            vim.command(cmds[0])
+        else:
+            vim.command('call VitraBatch([{0}])'.format(', '.join(
+                ["'{0}'".format(c.replace("'", "''")) for c in cmds])))
+
+    def flush(self):
+        while self.deferred:
+            self.command(self.deferred.pop(0))
+
 
 u_vim = Vim()
 
@@ -61,6 +284,47 @@ def truncate_words(text, num_words=10):
     return u' '.join(words[:num_words]) + u'...'
 
 
+def display_width(text):
+    if not text or max(text) < u'\u0300':
+        return len(text)
+    return sum([0 if unicodedata.combining(c) else
+                2 if unicodedata.east_asian_width(c) in ('W', 'F') else 1
+                for c in text])
+
+
+def truncate_width(text, width):
+    if display_width(text) <= width:
+        return text
+    ellipsis = u'...' if width > 3 else u''
+    size = width - len(ellipsis)
+    if max(text) < u'\u0300':
+        return text[:size] + ellipsis
+    used = 0
+    for end, c in enumerate(text):
+        used += display_width(c)
+        if used > size:
+            return text[:end] + ellipsis
+
+
+def align_columns(rows, widths=None):
+    if not rows:
+        return []
+    widths = widths or [None] * len(rows[0])
+    sizes = [0] * len(widths)
+    for row in rows:
+        for i, width in enumerate(widths):
+            if width:
+                row[i] = truncate_width(row[i], width)
+            sizes[i] = max(sizes[i], display_width(row[i]))
+    lines = []
+    for row in rows:
+        pads = [u' ' * (n - display_width(f)) for f, n in zip(row, sizes)]
+        fields = [pads[0] + row[0]]
+        fields.extend([f + p for f, p in zip(row[1:], pads[1:])])
+        lines.append(u' || '.join(fields).rstrip())
+    return lines
+
+
 def get_time(value, format=False):
     if isinstance(value, xmlrpclib.DateTime):
         dt = datetime.datetime.strptime(value.value, u'%Y%m%dT%H:%M:%S')
@@ -69,81 +333,1550 @@ def get_time(value, format=False):
     return dt.strftime(u'%a %d/%m/%Y %H:%M') if format else dt
 
 
-def save_buffer(buffer, file):
+def save_attachment(method, params, file):
     file_name = os.path.basename(file)
     if os.path.exists(file_name):
         u_vim.command(u'echoerr "File \'{0}\' exists!"'.format(file_name))
-    else:
-        with open(file_name, 'wb') as fp:
-            fp.write(buffer)
+        return False
+    progress = Progress(u'Downloading {0}'.format(file_name))
+    fp = open(file_name, 'wb')
+    saved = False
+    try:
+        with fp:
+            trac.server.download(method, params, fp, progress.update)
+        saved = True
+    finally:
+        if not saved:
+            try:
+                os.remove(file_name)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    print_error(e)
+    return True
 
 
 def save_html(html):
-    file_name = u_vim.eval('tracTempHtml')
+    file_name = u_vim.eval('g:tracTempHtml')
     with codecs.open(file_name, 'w', 'utf-8') as fp:
         fp.write(html)
     return file_name
 
 
+class HTMLText(HTMLParser.HTMLParser):
+    BLOCKS = ('p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol',
+              'dl', 'dt', 'dd', 'li', 'table', 'tr', 'pre', 'blockquote',
+              'hr', 'br')
+    HEADINGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+    WIDTH = 78
+
+    def __init__(self, base_url=''):
+        HTMLParser.HTMLParser.__init__(self)
+        self.base_url = base_url
+        self.lines = []
+        self.line = []
+        self.links = []
+        self.lists = []
+        self.bullet = None
+        self.anchor = None
+        self.heading = False
+        self.pre = 0
+        self.skip = 0
+        self.depth = 0
+
+    @property
+    def indent(self):
+        return u'   ' * (self.depth + len(self.lists) + 1)
+
+    def blank(self):
+        if self.lines and self.lines[-1]:
+            self.lines.append(u'')
+
+    def flush(self):
+        text, self.line = u''.join(self.line), []
+        if self.pre:
+            self.lines.extend(text.strip('\n').split('\n'))
+            return
+        text = u' '.join(text.split())
+        if not text:
+            return
+        indent = u'' if self.heading else self.indent
+        first = self.bullet if self.bullet is not None else indent
+        self.bullet = None
+        self.lines.extend(textwrap.wrap(text, self.WIDTH,
+                                        initial_indent=first,
+                                        subsequent_indent=indent))
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in ('script', 'style'):
+            self.skip += 1
+        elif tag in self.BLOCKS:
+            self.flush()
+            if tag in ('ul', 'ol'):
+                if not self.lists:
+                    self.blank()
+                self.lists.append(0 if tag == 'ol' else None)
+            elif tag == 'li' and self.lists:
+                indent = self.indent
+                if self.lists[-1] is None:
+                    self.bullet = u'{0}* '.format(indent[:-2])
+                else:
+                    self.lists[-1] += 1
+                    self.bullet = u'{0}{1:>3}. '.format(indent[:-5],
+                                                        self.lists[-1])
+            elif tag == 'hr':
+                self.blank()
+                self.lines.append(u'   ' + u'_' * (self.WIDTH - 3))
+            elif tag in ('dd', 'blockquote'):
+                self.depth += 1
+            elif tag not in ('br', 'tr', 'dt'):
+                self.blank()
+            if tag in self.HEADINGS:
+                self.heading = True
+            elif tag == 'pre':
+                self.pre += 1
+        elif tag in ('td', 'th') and self.line:
+            self.line.append(u' | ')
+        elif tag == 'a' and 'anchor' in attrs.get('class', '').split():
+            self.anchor = False
+            self.skip += 1
+        elif tag == 'a' and attrs.get('href', '#')[:1] != '#':
+            self.anchor = (len(self.line), attrs['href'])
+        elif tag == 'img' and attrs.get('alt'):
+            self.line.append(u'[{0}]'.format(attrs['alt']))
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            self.skip = max(self.skip - 1, 0)
+        elif tag in self.BLOCKS:
+            self.flush()
+            if tag in ('ul', 'ol') and self.lists:
+                self.lists.pop()
+                if not self.lists:
+                    self.blank()
+            elif tag in ('dd', 'blockquote'):
+                self.depth = max(self.depth - 1, 0)
+            elif tag == 'pre':
+                self.pre = max(self.pre - 1, 0)
+            self.heading = False
+        elif tag == 'a' and self.anchor is False:
+            self.anchor = None
+            self.skip = max(self.skip - 1, 0)
+        elif tag == 'a' and self.anchor:
+            start, href = self.anchor
+            self.anchor = None
+            if u''.join(self.line[start:]).strip():
+                self.links.append(urlparse.urljoin(self.base_url, href))
+                self.line.insert(start, u'[{0}]'.format(len(self.links)))
+
+    def handle_data(self, data):
+        if not self.skip:
+            self.line.append(data)
+
+    def handle_entityref(self, name):
+        if name in htmlentitydefs.name2codepoint:
+            self.handle_data(unichr(htmlentitydefs.name2codepoint[name]))
+        else:
+            self.handle_data(u'&{0};'.format(name))
+
+    def handle_charref(self, name):
+        try:
+            if name[:1] in ('x', 'X'):
+                self.handle_data(unichr(int(name[1:], 16)))
+            else:
+                self.handle_data(unichr(int(name)))
+        except ValueError:
+            pass
+
+    def text(self):
+        self.close()
+        self.flush()
+        lines = self.lines
+        while lines and not lines[-1]:
+            lines.pop()
+        if self.links:
+            lines.extend(['', 'References', ''])
+            lines.extend([u'{0:>4}. {1}'.format(i + 1, url)
+                          for i, url in enumerate(self.links)])
+        return u'\n'.join(lines)
+
+
+def html_to_text(html, base_url=''):
+    parser = HTMLText(base_url)
+    parser.feed(html)
+    return parser.text()
+
+
+class WikiFormatter(object):
+    MACROS = ('TOC', 'PageOutline', 'TitleIndex', 'RecentChanges', 'Image',
+              'TicketQuery', 'TracIni', 'MacroList', 'InterWiki')
+    MACRO = re.compile(r'\[\[(\w+)(\(.*?\))?\]\]')
+    HEADING = re.compile(r'^\s*(={1,6})\s+(.+?)\s+=+\s*(?:#\S+)?\s*$')
+    LIST = re.compile(r'^(\s+)([*-]|\d+\.|[a-zA-Z]\.|[ivxIVX]+\.)\s+(.*)$')
+    INLINE = re.compile(r"""
+        (?P<code>\{\{\{(?P<code_text>.*?)\}\}\}|`(?P<tick_text>[^`]*)`)
+      | (?P<escape>!(?P<escaped>[\w#\[\]:/.{}-]+))
+      | (?P<macro>\[\[(?P<macro_name>\w+)(?:\((?P<macro_args>.*?)\))?\]\])
+      | (?P<link2>\[\[(?P<link2_target>[^|\]]+)(?:\|(?P<link2_label>.*?))?\]\])
+      | (?P<link>\[(?P<link_target>[^\s\]]+)(?:\s+(?P<link_label>[^\]]+))?\])
+      | (?P<url>(?:https?|ftp)://[^\s<>"']+[^\s<>"'.,;:!?)\]])
+      | (?P<realm>(?:wiki|ticket|changeset|report|milestone|source|browser)
+                  :(?:"[^"]+"|[^\s\]]*[^\s\].,;:!?)]))
+      | (?P<ticket>\#\d+\b)
+      | (?P<changeset>\br\d+\b)
+      | (?P<bolditalic>'''''(?P<bi_text>.+?)''''')
+      | (?P<bold>'''(?P<b_text>.+?)'''|\*\*(?P<b2_text>.+?)\*\*)
+      | (?P<italic>''(?P<i_text>.+?)''|//(?P<i2_text>.+?)//)
+      | (?P<underline>__(?P<u_text>.+?)__)
+      | (?P<strike>~~(?P<s_text>.+?)~~)
+      | (?P<sup>\^(?P<sup_text>[^^]+?)\^)
+      | (?P<sub>,,(?P<sub_text>.+?),,)
+      | (?P<camel>(?<![\w/])(?:[A-Z][a-z0-9]+){2,}
+                  (?:/(?:[A-Z][a-z0-9]+){2,})*\b)
+    """, re.X)
+    REALMS = {
+        'wiki': 'wiki',
+        'ticket': 'ticket',
+        'changeset': 'changeset',
+        'report': 'report',
+        'milestone': 'milestone',
+        'source': 'browser',
+        'browser': 'browser',
+    }
+
+    def __init__(self, base_url=''):
+        self.base_url = base_url
+
+    @classmethod
+    def needs_server(cls, text):
+        if '{{{#!' in text:
+            return True
+        for name, args in cls.MACRO.findall(text):
+            if args or name in cls.MACROS:
+                return True
+        return False
+
+    def url(self, target):
+        if re.match(r'^(\w+://|mailto:)', target):
+            return target
+        if target.startswith('#'):
+            return u'{0}ticket/{1}'.format(self.base_url, target[1:])
+        if re.match(r'^r?\d+$', target):
+            return u'{0}changeset/{1}'.format(self.base_url,
+                                              target.lstrip('r'))
+        realm, sep, rest = target.partition(':')
+        if sep and realm in self.REALMS:
+            return u'{0}{1}/{2}'.format(self.base_url, self.REALMS[realm],
+                                        rest.strip('"'))
+        return u'{0}wiki/{1}'.format(self.base_url, target)
+
+    def link(self, target, label=None):
+        return u'<a href="{0}">{1}</a>'.format(cgi.escape(self.url(target),
+                                                          True),
+                                               cgi.escape(label or target))
+
+    def inline(self, text):
+        html = []
+        pos = 0
+        for m in self.INLINE.finditer(text):
+            html.append(cgi.escape(text[pos:m.start()]))
+            pos = m.end()
+            kind, g = m.lastgroup, m.group
+            if kind == 'code':
+                code = g('code_text')
+                if code is None:
+                    code = g('tick_text')
+                html.append(u'<tt>{0}</tt>'.format(cgi.escape(code)))
+            elif kind == 'escape':
+                html.append(cgi.escape(g('escaped')))
+            elif kind == 'macro':
+                if g('macro_name') == 'BR':
+                    html.append(u'<br />')
+                elif g('macro_args') is None and \
+                        g('macro_name') not in self.MACROS:
+                    html.append(self.link(g('macro_name')))
+                else:
+                    html.append(cgi.escape(g('macro')))
+            elif kind == 'link2':
+                html.append(self.link(g('link2_target').strip(),
+                                      g('link2_label')))
+            elif kind == 'link':
+                html.append(self.link(g('link_target'), g('link_label')))
+            elif kind in ('url', 'realm', 'ticket', 'changeset', 'camel'):
+                html.append(self.link(g(kind)))
+            elif kind == 'bolditalic':
+                html.append(u'<strong><em>{0}</em></strong>'.format(
+                    self.inline(g('bi_text'))))
+            else:
+                tag, inner = {
+                    'bold': ('strong', g('b_text') or g('b2_text')),
+                    'italic': ('em', g('i_text') or g('i2_text')),
+                    'underline': ('u', g('u_text')),
+                    'strike': ('del', g('s_text')),
+                    'sup': ('sup', g('sup_text')),
+                    'sub': ('sub', g('sub_text')),
+                }[kind]
+                html.append(u'<{0}>{1}</{0}>'.format(tag, self.inline(inner)))
+        html.append(cgi.escape(text[pos:]))
+        return u''.join(html)
+
+    def close_paragraph(self):
+        if self.paragraph:
+            self.html.append(u'<p>{0}</p>'.format(
+                self.inline(u'\n'.join(self.paragraph))))
+            self.paragraph = []
+
+    def close_lists(self, indent=-1, tag=None):
+        while self.lists and (self.lists[-1][0] > indent or
+                              (self.lists[-1][0] == indent and
+                               self.lists[-1][1] != tag)):
+            self.html.append(u'</li></{0}>'.format(self.lists.pop()[1]))
+
+    def close_table(self):
+        if self.table:
+            self.html.append(u'</table>')
+            self.table = False
+
+    def close_blocks(self):
+        self.close_paragraph()
+        self.close_lists()
+        self.close_table()
+
+    def format(self, text):
+        self.html = []
+        self.paragraph = []
+        self.lists = []
+        self.table = False
+        pre = None
+        for line in text.splitlines():
+            if pre is not None:
+                if line.strip() == '}}}':
+                    self.html.append(u'<pre class="wiki">{0}</pre>'.format(
+                        cgi.escape(u'\n'.join(pre))))
+                    pre = None
+                else:
+                    pre.append(line)
+                continue
+            if re.match(r'^\s*\{\{\{(#!.*)?\s*$', line):
+                self.close_blocks()
+                pre = []
+                continue
+            heading = self.HEADING.match(line)
+            item = self.LIST.match(line)
+            if not line.strip():
+                self.close_blocks()
+            elif heading:
+                self.close_blocks()
+                level = len(heading.group(1))
+                self.html.append(u'<h{0}>{1}</h{0}>'.format(
+                    level, self.inline(heading.group(2))))
+            elif re.match(r'^\s*-{4,}\s*$', line):
+                self.close_blocks()
+                self.html.append(u'<hr />')
+            elif re.match(r'^\s*\|\|.*\|\|\s*$', line):
+                self.close_paragraph()
+                self.close_lists()
+                if not self.table:
+                    self.html.append(u'<table class="wiki">')
+                    self.table = True
+                cells = []
+                for cell in line.strip()[2:-2].split('||'):
+                    if len(cell) > 1 and cell[0] == cell[-1] == '=':
+                        cells.append(u'<th>{0}</th>'.format(
+                            self.inline(cell[1:-1].strip())))
+                    else:
+                        cells.append(u'<td>{0}</td>'.format(
+                            self.inline(cell.strip())))
+                self.html.append(u'<tr>{0}</tr>'.format(u''.join(cells)))
+            elif item:
+                self.close_paragraph()
+                self.close_table()
+                indent = len(item.group(1))
+                tag = 'ul' if item.group(2) in ('*', '-') else 'ol'
+                self.close_lists(indent, tag)
+                if self.lists and self.lists[-1][0] == indent:
+                    self.html.append(u'</li>')
+                else:
+                    self.html.append(u'<{0}>'.format(tag))
+                    self.lists.append((indent, tag))
+                self.html.append(u'<li>{0}'.format(self.inline(item.group(3))))
+            elif self.lists and line[:1].isspace():
+                self.html.append(u' {0}'.format(self.inline(line.strip())))
+            else:
+                self.close_lists()
+                self.close_table()
+                self.paragraph.append(line.strip())
+        if pre is not None:
+            self.html.append(u'<pre class="wiki">{0}</pre>'.format(
+                cgi.escape(u'\n'.join(pre))))
+        self.close_blocks()
+        return u'\n'.join(self.html)
+
+
+def wiki_to_html(text, base_url=''):
+    return WikiFormatter(base_url).format(text)
+
+
 def map_commands(nmaps):
     for m in nmaps:
         u_vim.command(u'nnoremap <buffer> {0} {1}'.format(*m))
 
 
+def syntax_rules(options, chunk=200):
+    rules = [
+        'syn match Ignore /||/',
+        'syn match Number /\<\d*\>/',
+        'syn match Error /^\s*#.*$/',
+        'syn match Keyword /^\s-\s.*: .*$/ contains=Title',
+        'syn match Title /^\s-\s.*:/ contained',
+    ]
+    hilighters = ['Constant', 'Special', 'Identifier', 'Statement',
+                  'PreProc', 'Type', 'Underlined']
+    groups = dict([(hi, []) for hi in hilighters])
+    for name, values in sorted(options.items()):
+        for i, a in enumerate(values):
+            try:
+                float(a)
+            except ValueError:
+                a = a.replace(u'\\', u'\\\\').replace(u'/', u'\\/')
+                groups[hilighters[i % len(hilighters)]].append(a)
+    for hi in hilighters:
+        values = sorted(set(groups[hi]), key=len, reverse=True)
+        for i in range(0, len(values), chunk):
+            rules.append(u'syn match {0} /\\V\\<\\({1}\\)\\>/'.format(
+                hi, u'\\|'.join(values[i:i + chunk])))
+    return rules
+
+
 def print_error(e):
     err = str(e)
-    if '"' in err:
+    if '"' in err and is_main_thread():
         print(err)
     else:
+        err = err.replace('"', '\\"')
         u_vim.command(u'echoerr "Error: {0}"'.format(err))
 
 
-class HTTPDigestTransport(xmlrpclib.Transport):
-    def __init__(self, scheme, username, password, realm):
+class Cache(object):
+    SIZE = 1024
+
+    def __init__(self, server, name, keep=True):
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        root = u_vim.eval('g:tracCacheDir')
+        if root:
+            self.path = os.path.join(os.path.expanduser(root), server, name)
+        else:
+            self.path = None
+        self.size = self.SIZE if keep or not self.path else 0
+
+    def _remember(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            if self.size:
+                self.entries[key] = value
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def _file(self, key):
+        key = urllib.quote(unicode(key).encode('utf-8'), '')
+        return os.path.join(self.path, key)
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                value = self.entries.pop(key)
+                self.entries[key] = value
+                return value
+        if not self.path:
+            return default
+        try:
+            with open(self._file(key), 'rb') as fp:
+                value = pickle.load(fp)
+        except Exception:
+            return default
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        self._remember(key, value)
+        if not self.path:
+            return
+        file_name = self._file(key)
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            fd, temp_name = tempfile.mkstemp(dir=self.path)
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump(value, fp, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_name, file_name)
+        except (IOError, OSError):
+            pass
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+        if not self.path:
+            return
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+
+class Mirror(object):
+    BATCH_SIZE = 100
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB);
+        CREATE TABLE IF NOT EXISTS ticket (id INTEGER PRIMARY KEY, data BLOB);
+        CREATE TABLE IF NOT EXISTS attr (ticket INTEGER, name TEXT,
+                                         value TEXT);
+        CREATE INDEX IF NOT EXISTS attr_name ON attr (name, value);
+        CREATE INDEX IF NOT EXISTS attr_ticket ON attr (ticket);
+        CREATE TABLE IF NOT EXISTS change (ticket INTEGER, time TEXT,
+                                           author TEXT, field TEXT,
+                                           oldvalue TEXT, newvalue TEXT);
+        CREATE INDEX IF NOT EXISTS change_ticket ON change (ticket);
+    '''
+
+    def __init__(self, server):
+        self.lock = threading.Lock()
+        self.db = self.connect(server)
+        try:
+            self.db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS search '
+                            'USING fts4(summary, description, comments)')
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+
+    def connect(self, server):
+        root = u_vim.eval('g:tracCacheDir')
+        if root:
+            path = os.path.join(os.path.expanduser(root), server)
+            try:
+                if not os.path.isdir(path):
+                    os.makedirs(path)
+                db = sqlite3.connect(os.path.join(path, 'mirror.db'),
+                                     check_same_thread=False)
+                db.executescript(self.SCHEMA)
+                return db
+            except (OSError, sqlite3.Error):
+                pass
+        db = sqlite3.connect(':memory:', check_same_thread=False)
+        db.executescript(self.SCHEMA)
+        return db
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.db.execute('SELECT value FROM meta WHERE key = ?',
+                                  (key, )).fetchone()
+        return pickle.loads(str(row[0])) if row else default
+
+    def set_meta(self, key, value):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            with self.db:
+                self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                                (key, sqlite3.Binary(value)))
+
+    def sync(self):
+        since = self.get_meta('since')
+        if since is None:
+            synced = datetime.datetime.utcnow() - SYNC_MARGIN
+            ids = trac.server.ticket.query('max=0&order=id')
+        else:
+            synced = since
+            ids = trac.server.ticket.getRecentChanges(
+                xmlrpclib.DateTime(since))
+        for i in range(0, len(ids), self.BATCH_SIZE):
+            batch = ids[i:i + self.BATCH_SIZE]
+            mc = xmlrpclib.MultiCall(trac.server)
+            for tid in batch:
+                mc.ticket.get(tid)
+                mc.ticket.changeLog(tid)
+            result = mc()
+            with self.lock:
+                with self.db:
+                    for j, tid in enumerate(batch):
+                        self.remove(tid)
+                        try:
+                            ticket = result[2 * j]
+                            self.store(ticket, result[2 * j + 1])
+                        except xmlrpclib.Fault:
+                            continue
+                        synced = max(synced, get_time(ticket[2]) +
+                                     datetime.timedelta(seconds=1))
+        self.set_meta('since', synced)
+        return ids if since is not None else []
+
+    def remove(self, tid):
+        for table, column in (('ticket', 'id'), ('attr', 'ticket'),
+                              ('change', 'ticket')):
+            self.db.execute(u'DELETE FROM {0} WHERE {1} = ?'.format(table,
+                            column), (tid, ))
+        if self.fts:
+            self.db.execute('DELETE FROM search WHERE docid = ?', (tid, ))
+
+    def store(self, ticket, changelog):
+        def text(value):
+            if isinstance(value, xmlrpclib.DateTime):
+                return value.value
+            return unicode(value)
+
+        tid = ticket[0]
+        data = pickle.dumps(ticket, pickle.HIGHEST_PROTOCOL)
+        self.db.execute('INSERT INTO ticket VALUES (?, ?)',
+                        (tid, sqlite3.Binary(data)))
+        self.db.executemany('INSERT INTO attr VALUES (?, ?, ?)',
+                            [(tid, k, text(v)) for k, v
+                             in ticket[3].iteritems()])
+        self.db.executemany('INSERT INTO change VALUES (?, ?, ?, ?, ?, ?)',
+                            [(tid, text(c[0]), c[1], c[2], text(c[3]),
+                              text(c[4])) for c in changelog])
+        if self.fts:
+            comments = u'\n'.join([c[4] for c in changelog
+                                   if c[2] == 'comment'])
+            self.db.execute('INSERT INTO search (docid, summary, '
+                            'description, comments) VALUES (?, ?, ?, ?)',
+                            (tid, ticket[3].get('summary', u''),
+                             ticket[3].get('description', u''), comments))
+
+    def query(self, query, options):
+        if self.get_meta('since') is None:
+            return None
+        sorter = {'order': 'priority', 'group': None}
+        desc = {'order': False, 'group': False}
+        per_page, page = 100, 1
+        where, params = [], []
+        for part in query.split('&'):
+            m = re.match(r'(\w+)(!?[~^$]?)=(.*)$', part)
+            if not part:
+                continue
+            elif not m:
+                return None
+            name, mode, value = m.groups()
+            if name in ('order', 'group'):
+                sorter[name] = value
+            elif name in ('desc', 'groupdesc'):
+                desc['order' if name == 'desc' else 'group'] = value == '1'
+            elif name in ('max', 'page'):
+                try:
+                    per_page, page = ((int(value), page) if name == 'max'
+                                      else (per_page, int(value)))
+                except ValueError:
+                    return None
+            elif name in ('col', 'row', 'report', 'format'):
+                continue
+            elif name == 'id' or '..' in value or '$USER' in value:
+                return None
+            else:
+                if mode in ('', '!') and value[:1] in ('~', '^', '$'):
+                    mode, value = mode + value[0], value[1:]
+                if not mode and value[:1] == '!':
+                    mode, value = '!', value[1:]
+                values = value.split('|')
+                op = mode.lstrip('!')
+                if op:
+                    pattern = {'~': u'%{0}%', '^': u'{0}%', '$': u'%{0}'}[op]
+                    cond = u' OR '.join([u"value LIKE ? ESCAPE '\\'"] *
+                                        len(values))
+                    values = [pattern.format(re.sub(r'([%_\\])', r'\\\1', v))
+                              for v in values]
+                else:
+                    cond = u'value IN ({0})'.format(u', '.join(
+                        [u'?'] * len(values)))
+                where.append(u'id {0}IN (SELECT ticket FROM attr WHERE '
+                             u'name = ? AND ({1}))'.format(
+                                 u'NOT ' if mode.startswith('!') else u'',
+                                 cond))
+                params.extend([name] + values)
+
+        sql = u'SELECT id FROM ticket'
+        if where:
+            sql = u'{0} WHERE {1}'.format(sql, u' AND '.join(where))
+        with self.lock:
+            ids = [r[0] for r in self.db.execute(sql, params)]
+            if sorter['order'] == 'id':
+                ids.sort(reverse=desc['order'])
+            for key in ('order', 'group'):
+                field = sorter[key]
+                if not field or field == 'id':
+                    continue
+                values = dict(self.db.execute('SELECT ticket, value FROM '
+                                              'attr WHERE name = ?',
+                                              (field, )).fetchall())
+                rank = dict([(v, i) for i, v in
+                             enumerate(options.get(field, []))])
+                ids.sort(key=lambda t: (rank.get(values.get(t), len(rank)),
+                                        values.get(t)),
+                         reverse=desc[key])
+            total = len(ids)
+            if per_page:
+                ids = ids[(page - 1) * per_page:page * per_page]
+            tickets = {}
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                rows = self.db.execute(u'SELECT id, data FROM ticket WHERE '
+                                       u'id IN ({0})'.format(u', '.join(
+                                           [u'?'] * len(batch))), batch)
+                for tid, data in rows:
+                    tickets[tid] = pickle.loads(str(data))
+        return total, [tickets[tid] for tid in ids]
+
+    def search(self, keyword):
+        terms = keyword.split()
+        with self.lock:
+            if self.fts:
+                match = u' '.join([u'"{0}"'.format(t.replace(u'"', u'""'))
+                                   for t in terms])
+                rows = self.db.execute(
+                    "SELECT docid, snippet(search, '', '', '...', -1, 15) "
+                    "FROM search WHERE search MATCH ? ORDER BY docid DESC",
+                    (match, )).fetchall()
+            else:
+                sql = ("SELECT ticket FROM attr WHERE name IN ('summary', "
+                       "'description') AND value LIKE ? UNION SELECT "
+                       "ticket FROM change WHERE field = 'comment' AND "
+                       "newvalue LIKE ?")
+                ids = None
+                for term in terms:
+                    pattern = u'%{0}%'.format(term)
+                    found = set([r[0] for r in self.db.execute(
+                        sql, (pattern, pattern))])
+                    ids = found if ids is None else ids & found
+                rows = []
+                for tid in sorted(ids or [], reverse=True):
+                    row = self.db.execute("SELECT value FROM attr WHERE "
+                                          "ticket = ? AND name = 'summary'",
+                                          (tid, )).fetchone()
+                    rows.append((tid, row[0] if row else u''))
+        return [[u'/ticket/{0}'.format(tid), u'', None, u'', excerpt]
+                for tid, excerpt in rows]
+
+
+class CompletionIndex(object):
+    def __init__(self, words=()):
+        self.words = set()
+        self.keys = []
+        self.update(words)
+
+    def update(self, words):
+        words = set(words)
+        added = words - self.words
+        removed = self.words - words
+        if len(added) + len(removed) > 32:
+            self.words = words
+            self.keys = sorted([(w.lower(), w) for w in words])
+            return
+        for word in added:
+            self.add(word)
+        for word in removed:
+            self.remove(word)
+
+    def add(self, word):
+        if word not in self.words:
+            self.words.add(word)
+            bisect.insort(self.keys, (word.lower(), word))
+
+    def remove(self, word):
+        if word in self.words:
+            self.words.discard(word)
+            self.keys.remove((word.lower(), word))
+
+    def match(self, text, limit=50):
+        text = text.lower()
+        start = bisect.bisect_left(self.keys, (text, ))
+        result = []
+        for key, word in self.keys[start:start + limit]:
+            if not key.startswith(text):
+                break
+            result.append(word)
+        if len(result) >= limit or not text:
+            return result
+
+        found = set(result)
+        inner = sorted([(key.find(text), key, word)
+                        for key, word in self.keys
+                        if text in key and word not in found])
+        result.extend([w for i, k, w in inner[:limit - len(result)]])
+        if len(result) >= limit:
+            return result
+
+        found.update(result)
+        fuzzy = re.compile(u'.*?'.join([re.escape(c) for c in text]))
+        scored = []
+        for key, word in self.keys:
+            m = fuzzy.search(key)
+            if m and word not in found:
+                scored.append((m.end() - m.start(), m.start(), key, word))
+        scored.sort()
+        result.extend([w for n, i, k, w in scored[:limit - len(result)]])
+        return result
+
+
+def complete(index, text):
+    if not isinstance(text, unicode):
+        text = text.decode(Vim._encoding, 'replace')
+    limit = int(u_vim.eval('g:tracCompletionLimit'))
+    options = u_vim.encode(index.match(text, limit))
+    u_vim.command('let g:tracOptions={0}'.format(options))
+
+
+def rpc_methods(request):
+    m = re.search(r'<methodName>([^<]*)</methodName>', request[:512])
+    name = m.group(1) if m else 'unknown'
+    if name != 'system.multicall':
+        return name, [name]
+    return name, re.findall(r'<name>methodName</name>\s*<value>'
+                            r'(?:<string>)?([^<]*)<', request)
+
+
+class Metrics(object):
+    BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.entries = {}
+
+    def record(self, kind, name, seconds=None, sent=0, received=0):
+        with self.lock:
+            entry = self.entries.setdefault((kind, name), {
+                'count': 0,
+                'total': 0.0,
+                'max': 0.0,
+                'sent': 0,
+                'received': 0,
+                'histogram': [0] * (len(self.BUCKETS) + 1),
+            })
+            entry['count'] += 1
+            entry['sent'] += sent
+            entry['received'] += received
+            if seconds is not None:
+                ms = seconds * 1000
+                entry['total'] += ms
+                entry['max'] = max(entry['max'], ms)
+                entry['histogram'][bisect.bisect_left(self.BUCKETS, ms)] += 1
+
+    def record_call(self, request, received, network, parsing):
+        name, methods = rpc_methods(request)
+        if name == 'system.multicall':
+            for method in methods:
+                self.record('batched', method)
+            size = 1
+            while size < len(methods):
+                size *= 2
+            name = 'system.multicall[<={0}]'.format(size)
+        self.record('rpc', name, network, len(request), received)
+        self.record('parse', name, parsing)
+
+    def percentile(self, entry, fraction):
+        timed = sum(entry['histogram'])
+        seen = 0
+        for bound, count in zip(self.BUCKETS, entry['histogram']):
+            seen += count
+            if timed and seen >= timed * fraction:
+                return bound
+        return entry['max']
+
+    def export(self):
+        with self.lock:
+            result = {'buckets': list(self.BUCKETS)}
+            for (kind, name), entry in self.entries.items():
+                result.setdefault(kind, {})[name] = dict(entry)
+        return result
+
+    def report(self):
+        lines = []
+        with self.lock:
+            entries = sorted(self.entries.items())
+        for kind in ('view', 'render', 'rpc', 'parse', 'batched', 'http'):
+            rows = [[u'Count', u'Name', u'Avg ms', u'P50', u'P95', u'Max',
+                     u'Sent KB', u'Recv KB', u'Histogram (<=ms:count)']]
+            for (k, name), entry in entries:
+                if k != kind:
+                    continue
+                timed = sum(entry['histogram'])
+                histogram = u' '.join([u'{0}:{1}'.format(b, c) for b, c in
+                                       zip(self.BUCKETS + (u'inf', ),
+                                           entry['histogram']) if c])
+                rows.append([unicode(entry['count']), name,
+                             u'{0:.1f}'.format(entry['total'] / (timed or 1)),
+                             unicode(self.percentile(entry, 0.5)),
+                             unicode(self.percentile(entry, 0.95)),
+                             u'{0:.1f}'.format(entry['max']),
+                             unicode(entry['sent'] // 1024),
+                             unicode(entry['received'] // 1024),
+                             histogram])
+            if len(rows) > 1:
+                lines.extend([u'= {0} ='.format(kind.title()), u''])
+                lines.extend(align_columns(rows))
+                lines.append(u'')
+        return lines
+
+
+metrics = Metrics()
+
+
+class Executor(object):
+    def __init__(self):
+        self.jobs = {}
+        self.results = Queue.Queue()
+        self.tokens = {}
+        self.pending = 0
+        self.timer = None
+
+    @property
+    def enabled(self):
+        return u_vim.eval('has("timers") && g:tracAsync') == '1'
+
+    def submit(self, channel, job, callback, progress=None):
+        token = self.cancel(channel)
+        if progress is not None:
+            job = functools.partial(job, functools.partial(self.report,
+                                    channel, token, progress))
+        if not self.enabled:
+            try:
+                callback(job())
+            finally:
+                u_vim.flush()
+            return
+        if channel not in self.jobs:
+            self.jobs[channel] = Queue.Queue()
+            thread = threading.Thread(target=self.run,
+                                      args=(self.jobs[channel], ))
+            thread.daemon = True
+            thread.start()
+        if self.timer is None:
+            self.timer = u_vim.eval("timer_start(50, 'VitraPoll', "
+                                    "{'repeat': -1})")
+        self.pending += 1
+        self.jobs[channel].put((channel, token, job, callback))
+
+    def cancel(self, channel):
+        self.tokens[channel] = self.tokens.get(channel, 0) + 1
+        return self.tokens[channel]
+
+    def report(self, channel, token, progress, result):
+        if is_main_thread():
+            progress(result)
+        else:
+            self.results.put((channel, token, None, result, progress, False))
+
+    def run(self, jobs):
+        while True:
+            channel, token, job, callback = jobs.get()
+            error, result = None, None
+            if self.tokens.get(channel) == token:
+                try:
+                    result = job()
+                except Exception as e:
+                    error = e
+            self.results.put((channel, token, error, result, callback,
+                              True))
+
+    def poll(self):
+        while True:
+            try:
+                channel, token, error, result, callback, done = \
+                    self.results.get_nowait()
+            except Queue.Empty:
+                break
+            if done:
+                self.pending -= 1
+            if self.tokens.get(channel) != token:
+                continue
+            if error is not None:
+                print_error(error)
+            else:
+                callback(result)
+        u_vim.flush()
+        if not self.pending and self.timer is not None:
+            u_vim.command('call timer_stop({0})'.format(self.timer))
+            self.timer = None
+
+
+class Prefetcher(object):
+    def __init__(self):
+        self.queue = Queue.PriorityQueue()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.generation = 0
+        self.budget = 0
+        self.spent = collections.deque()
+
+    def schedule(self, jobs):
+        self.cancel()
+        workers = int(u_vim.eval('g:tracPrefetchWorkers'))
+        self.budget = int(u_vim.eval('g:tracPrefetchBudget'))
+        if not workers:
+            return
+        while len(self.threads) < workers:
+            thread = threading.Thread(target=self.run)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        for priority, job in enumerate(jobs):
+            self.queue.put((self.generation, priority, job))
+
+    def cancel(self):
+        self.generation += 1
+
+    def available(self):
+        with self.lock:
+            start = time.time() - PREFETCH_WINDOW
+            while self.spent and self.spent[0][0] < start:
+                self.spent.popleft()
+            return self.budget - sum([size for t, size in self.spent])
+
+    def run(self):
+        while True:
+            generation, priority, job = self.queue.get()
+            if generation != self.generation or self.available() <= 0:
+                continue
+            try:
+                size = job()
+            except Exception:
+                continue
+            with self.lock:
+                self.spent.append((time.time(), size))
+
+
+class WorkerPool(object):
+    def __init__(self):
+        self.jobs = Queue.Queue()
+        self.threads = []
+
+    def imap(self, func, items, workers):
+        if workers <= 1 or len(items) <= 1:
+            for item in items:
+                yield func(item)
+            return
+        while len(self.threads) < workers:
+            thread = threading.Thread(target=self.run)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        results = Queue.Queue()
+        pending = iter(enumerate(items))
+        for index, item in itertools.islice(pending, workers):
+            self.jobs.put((results, index, func, item))
+        done = {}
+        for index in range(len(items)):
+            while index not in done:
+                i, error, result = results.get()
+                done[i] = error, result
+            error, result = done.pop(index)
+            if error is not None:
+                raise error
+            for i, item in itertools.islice(pending, 1):
+                self.jobs.put((results, i, func, item))
+            yield result
+
+    def run(self):
+        while True:
+            results, index, func, item = self.jobs.get()
+            try:
+                results.put((index, None, func(item)))
+            except Exception as e:
+                results.put((index, e, None))
+
+
+class Progress(object):
+    def __init__(self, title):
+        self.title = title
+        self.shown = None
+
+    def update(self, done, total):
+        if total:
+            status = u'{0}%'.format(done * 100 // total)
+        else:
+            status = u'{0}k'.format(done // 1024)
+        if status != self.shown:
+            self.shown = status
+            u_vim.command(u'redraw | echo "{0}: {1}"'.format(self.title,
+                                                             status))
+
+
+class AttachmentBody(object):
+    CHUNK_SIZE = 3 * 16384
+
+    def __init__(self, method, params, file, progress=None):
+        request = xmlrpclib.dumps(params + (xmlrpclib.Binary(''),), method)
+        self.head = request[:request.rindex('<base64>') + len('<base64>')]
+        self.tail = request[request.rindex('</base64>'):]
+        self.file = file
+        self.size = os.path.getsize(file)
+        self.progress = progress
+        self.seek(0)
+
+    def __len__(self):
+        return len(self.head) + (self.size + 2) // 3 * 4 + len(self.tail)
+
+    def chunks(self):
+        yield self.head
+        with open(self.file, 'rb') as fp:
+            while True:
+                data = fp.read(self.CHUNK_SIZE)
+                if not data:
+                    break
+                yield base64.b64encode(data)
+                if self.progress:
+                    self.progress(fp.tell(), self.size)
+        yield self.tail
+
+    def seek(self, offset):
+        self.buffer = ''
+        self.iterator = self.chunks()
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.iterator)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class RPCBatch(object):
+    WRITES = re.compile(r'^system\.|\.(put|update|create|delete)')
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def session(self):
+        return {'queue': [], 'memo': {}}
+
+    @contextlib.contextmanager
+    def active(self, session):
+        previous = getattr(self.local, 'session', None)
+        self.local.session = session
+        try:
+            yield session
+        finally:
+            self.local.session = previous
+
+    def key(self, method, params):
+        if self.WRITES.search(method):
+            return None
+        return method, xmlrpclib.dumps(tuple(params), allow_none=True)
+
+    def defer(self, method, params):
+        session = getattr(self.local, 'session', None)
+        if session is not None:
+            session['queue'].append((method, params))
+
+    def call(self, send, method, params):
+        if method == 'system.multicall':
+            calls = [(c['methodName'], tuple(c['params'])) for c in params[0]]
+        else:
+            calls = [(method, params)]
+
+        session = getattr(self.local, 'session', None)
+        queued, memo = [], None
+        if session is not None:
+            queued, session['queue'] = session['queue'], []
+            memo = session['memo']
+        order = [(m, p, i) for i, (m, p) in enumerate(calls)]
+        if any([self.WRITES.search(m) for m, p in calls]):
+            if memo is not None:
+                memo.clear()
+            order.extend([(m, p, None) for m, p in queued])
+        else:
+            order[:0] = [(m, p, None) for m, p in queued]
+
+        request, keys, targets, sent = [], [], [], {}
+        results = [None] * len(calls)
+        for method_, params_, i in order:
+            key = self.key(method_, params_) if memo is not None else None
+            if key is not None and key in memo:
+                if i is not None:
+                    results[i] = memo[key]
+            elif key is not None and key in sent:
+                if i is not None:
+                    targets[sent[key]].append(i)
+            else:
+                if key is not None:
+                    sent[key] = len(request)
+                request.append((method_, params_))
+                keys.append(key)
+                targets.append([] if i is None else [i])
+
+        try:
+            if len(request) == 1:
+                response = [[send(*request[0])]]
+            elif request:
+                response = send('system.multicall', ([
+                    {'methodName': m, 'params': list(p)} for m, p in request
+                ], ))
+            else:
+                response = []
+        except xmlrpclib.Fault as e:
+            response = [{'faultCode': e.faultCode,
+                         'faultString': e.faultString}] * len(request)
+
+        for key, value, indexes in zip(keys, response, targets):
+            if isinstance(value, dict):
+                value = xmlrpclib.Fault(value['faultCode'],
+                                        value['faultString'])
+            elif memo is not None and key is not None:
+                memo[key] = value
+            for i in indexes:
+                results[i] = value
+
+        if method != 'system.multicall':
+            if isinstance(results[0], xmlrpclib.Fault):
+                raise results[0]
+            return results[0][0]
+        return [{'faultCode': r.faultCode, 'faultString': r.faultString}
+                if isinstance(r, xmlrpclib.Fault) else r for r in results]
+
+
+class ServerProxy(xmlrpclib.ServerProxy):
+    CHUNK_SIZE = 65536
+
+    def __init__(self, uri, transport, batch=None):
+        xmlrpclib.ServerProxy.__init__(self, uri, transport=transport)
+        self.transport = transport
+        self.batch = batch or RPCBatch()
+        self.host, self.handler = urllib.splithost(urllib.splittype(uri)[1])
+
+    def _ServerProxy__request(self, method, params):
+        return self.batch.call(self.send, method, params)
+
+    def send(self, method, params):
+        return xmlrpclib.ServerProxy._ServerProxy__request(self, method,
+                                                           params)
+
+    def defer(self, method, *params):
+        self.batch.defer(method, params)
+
+    def upload(self, method, params, file, progress=None):
+        start = time.time()
+        body = AttachmentBody(method, params, file, progress)
+        response = self.transport.open(self.host, self.handler, body)
+        result = self.transport.parse_response(response)[0]
+        metrics.record('rpc', method, time.time() - start, len(body))
+        return result
+
+    def fetch(self, handler):
+        start = time.time()
+        response = self.transport.open(self.host, handler, None, 'GET')
+        received = 0
+        try:
+            while True:
+                chunk = response.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+                yield chunk
+        except:
+            self.transport.close()
+            raise
+        name = u'GET {0}'.format(handler.split('?')[0].rsplit('/', 1)[0])
+        metrics.record('http', name, time.time() - start, 0, received)
+
+    def download(self, method, params, fp, progress=None):
+        start = time.time()
+        body = xmlrpclib.dumps(params, method)
+        response = self.transport.open(self.host, self.handler, body)
+        try:
+            received = self.read_binary(response, fp, progress)
+        except:
+            self.transport.close()
+            raise
+        metrics.record('rpc', method, time.time() - start, len(body),
+                       received)
+
+    def read_binary(self, response, fp, progress=None):
+        total = int(response.getheader('content-length') or 0)
+        data, done, started = '', 0, False
+        while True:
+            chunk = response.read(self.CHUNK_SIZE)
+            done += len(chunk)
+            data += chunk
+            if not started:
+                if '<base64>' not in data:
+                    if '<fault>' in data or not chunk:
+                        xmlrpclib.loads(data + response.read())
+                        raise xmlrpclib.ResponseError(data)
+                    continue
+                data = data[data.index('<base64>') + len('<base64>'):]
+                started = True
+            end = data.find('</base64>')
+            if end >= 0:
+                fp.write(base64.b64decode(''.join(data[:end].split())))
+                done += len(response.read())
+                if progress:
+                    progress(total or done, total)
+                return done
+            if not chunk:
+                raise xmlrpclib.ResponseError('Truncated attachment')
+            data = ''.join(data.split())
+            keep = len(data) % 4 + 12
+            fp.write(base64.b64decode(data[:-keep]))
+            data = data[-keep:]
+            if progress:
+                progress(done, total)
+
+
+BOUND = threading.local()
+
+
+class Connections(object):
+    def __init__(self, connect):
+        self.connect = connect
+        self.main = connect()
+        self.local = threading.local()
+        self.servers = []
+        self.lock = threading.Lock()
+        self.users = 0
+        self.closed = False
+
+    def get(self):
+        if is_main_thread():
+            return self.main
+        if getattr(self.local, 'server', None) is None:
+            self.local.server = self.connect()
+            with self.lock:
+                self.servers.append(self.local.server)
+        return self.local.server
+
+    def bind(self, job):
+        def wrapper(*args):
+            previous = getattr(BOUND, 'connections', None)
+            BOUND.connections = self
+            with self.lock:
+                self.users += 1
+            try:
+                return job(*args)
+            finally:
+                BOUND.connections = previous
+                with self.lock:
+                    self.users -= 1
+                    idle = self.closed and not self.users
+                if idle:
+                    self.shutdown()
+        return wrapper
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            idle = not self.users
+        if idle:
+            self.shutdown()
+
+    def shutdown(self):
+        with self.lock:
+            servers, self.servers = [self.main] + self.servers, []
+        for server in servers:
+            if server is not None:
+                server('close')()
+
+
+class CountingResponse(object):
+    def __init__(self, response):
+        self.response = response
+        self.size = 0
+        self.elapsed = 0
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def read(self, size=-1):
+        start = time.time()
+        data = self.response.read(size)
+        self.elapsed += time.time() - start
+        self.size += len(data)
+        return data
+
+
+class HTTPTransport(xmlrpclib.Transport):
+    def __init__(self, scheme):
         xmlrpclib.Transport.__init__(self)
+        self.scheme = scheme
+        self.cookies = {}
+        self.verbose = 0
+        self._connection = (None, None)
+
+    def make_connection(self, host):
+        if self._connection[0] == host:
+            return self._connection[1]
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        if self.scheme == 'https':
+            connection = httplib.HTTPSConnection(chost, None, **(x509 or {}))
+        else:
+            connection = httplib.HTTPConnection(chost)
+        self._connection = (host, connection)
+        return connection
+
+    def close(self):
+        if self._connection[1]:
+            self._connection[1].close()
+        self._connection = (None, None)
+
+    def authenticate(self, challenge, host):
+        return False
+
+    def authorization(self, handler, method='POST'):
+        return None
+
+    def send(self, host, handler, request_body, method='POST'):
+        headers = {'User-Agent': self.user_agent}
+        if method == 'POST':
+            headers['Content-Type'] = 'text/xml'
+        authorization = self.authorization(handler, method)
+        if authorization:
+            headers['Authorization'] = authorization
+        if self.cookies:
+            headers['Cookie'] = '; '.join(['{0}={1}'.format(*c)
+                                          for c in self.cookies.items()])
+        if hasattr(request_body, 'read'):
+            headers['Content-Length'] = str(len(request_body))
+        for attempt in (0, 1):
+            reused = self._connection[0] == host
+            connection = self.make_connection(host)
+            if hasattr(request_body, 'seek'):
+                request_body.seek(0)
+            sent = False
+            try:
+                connection.request(method, handler, request_body, headers)
+                sent = True
+                return connection.getresponse()
+            except (socket.error, httplib.BadStatusLine) as e:
+                self.close()
+                if (attempt or not reused or getattr(e, 'errno', None) not in
+                        (None, errno.ECONNRESET, errno.ECONNABORTED,
+                         errno.EPIPE) or
+                        sent and not self.replayable(method, request_body)):
+                    raise
+
+    def replayable(self, method, request_body):
+        if method == 'GET':
+            return True
+        if not isinstance(request_body, basestring):
+            return False
+        return not any([RPCBatch.WRITES.search(m)
+                        for m in rpc_methods(request_body)[1]])
+
+    def request(self, host, handler, request_body, verbose=0):
+        self.verbose = verbose
+        start = time.time()
+        response = CountingResponse(self.open(host, handler, request_body))
+        opened = time.time()
+        result = self.parse_response(response)
+        parsing = time.time() - opened - response.elapsed
+        metrics.record_call(request_body, response.size,
+                            opened - start + response.elapsed, parsing)
+        return result
+
+    def open(self, host, handler, request_body, method='POST'):
+        response = self.send(host, handler, request_body, method)
+        challenge = response.getheader('www-authenticate', '')
+        if response.status == 401 and self.authenticate(challenge, host):
+            response.read()
+            response = self.send(host, handler, request_body, method)
+        if response.status != 200:
+            response.read()
+            raise xmlrpclib.ProtocolError(host + handler, response.status,
+                                          response.reason, response.msg)
+        for header in response.msg.getheaders('set-cookie'):
+            cookie = Cookie.SimpleCookie()
+            try:
+                cookie.load(header)
+            except Cookie.CookieError:
+                continue
+            for name, morsel in cookie.items():
+                self.cookies[name] = morsel.value
+        return response
+
+
+class HTTPBasicTransport(HTTPTransport):
+    def __init__(self, scheme, auth):
+        HTTPTransport.__init__(self, scheme)
+        if auth:
+            self.credentials = 'Basic {0}'.format(
+                base64.b64encode(urllib.unquote(auth)))
+        else:
+            self.credentials = None
+
+    def authorization(self, handler, method='POST'):
+        return self.credentials
+
+
+class HTTPDigestTransport(HTTPTransport):
+    def __init__(self, scheme, username, password, realm):
+        HTTPTransport.__init__(self, scheme)
         self.username = username
         self.password = password
         self.realm = realm
-        self.scheme = scheme
+        self.challenge = None
+        self.nonce_count = 0
 
-    def request(self, host, handler, request_body, verbose):
-        url = '{scheme}://{host}{handler}'.format(scheme=self.scheme,
-                                                  host=host, handler=handler)
-        self.verbose = verbose
-        request = urllib2.Request(url)
-        request.add_data(request_body)
-        request.add_header('User-Agent', self.user_agent)
-        request.add_header('Content-Type', 'text/xml')
+    def authenticate(self, challenge, host):
+        m = re.search(r'digest\s+(.*)', challenge, re.I)
+        if not m:
+            return False
+        values = urllib2.parse_keqv_list(urllib2.parse_http_list(m.group(1)))
+        if self.realm and values.get('realm') != self.realm:
+            return False
+        self.challenge = values
+        self.nonce_count = 0
+        return True
 
-        authhandler = urllib2.HTTPDigestAuthHandler()
-        authhandler.add_password(self.realm, url, self.username, self.password)
-        opener = urllib2.build_opener(authhandler)
-        f = opener.open(request)
-        return self.parse_response(f)
+    def authorization(self, handler, method='POST'):
+        if not self.challenge:
+            return None
+        md5 = lambda text: hashlib.md5(text).hexdigest()
+        c = self.challenge
+        self.nonce_count += 1
+        nc = '{0:08x}'.format(self.nonce_count)
+        cnonce = md5(os.urandom(8))[:16]
+        ha1 = md5(':'.join([self.username, c['realm'], self.password]))
+        ha2 = md5(':'.join([method, handler]))
+        qop = 'auth' in c.get('qop', '').split(',')
+        if qop:
+            response = md5(':'.join([ha1, c['nonce'], nc, cnonce, 'auth',
+                                     ha2]))
+        else:
+            response = md5(':'.join([ha1, c['nonce'], ha2]))
+        header = ('Digest username="{0}", realm="{1}", nonce="{2}", '
+                  'uri="{3}", response="{4}", algorithm="MD5"').format(
+                        self.username, c['realm'], c['nonce'], handler,
+                        response)
+        if 'opaque' in c:
+            header += ', opaque="{0}"'.format(c['opaque'])
+        if qop:
+            header += ', qop=auth, nc={0}, cnonce="{1}"'.format(nc, cnonce)
+        return header
 
 
 try:
+    import kerberos
     import urllib2_kerberos
 
-    class HTTPKerberosTransport(xmlrpclib.Transport):
+    class HTTPKerberosTransport(HTTPTransport):
         def __init__(self, scheme):
-            xmlrpclib.Transport.__init__(self)
-            self.scheme = scheme
-            self._opener = urllib2.build_opener()
-            kerberos_handler = urllib2_kerberos.HTTPKerberosAuthHandler()
-            self._opener.add_handler(kerberos_handler)
+            HTTPTransport.__init__(self, scheme)
+            self.token = None
 
-        def request(self, host, handler, request_body, verbose):
-            url = '{scheme}://{host}{handler}'.format(scheme=self.scheme,
-                                                    host=host, handler=handler)
-            self.verbose = verbose
-            request = urllib2.Request(url)
-            request.add_data(request_body)
-            request.add_header('User-Agent', self.user_agent)
-            request.add_header('Content-Type', 'text/xml')
+        def authenticate(self, challenge, host):
+            if 'negotiate' not in challenge.lower():
+                return False
+            service = 'HTTP@{0}'.format(host.split(':')[0])
+            result, context = kerberos.authGSSClientInit(service)
+            kerberos.authGSSClientStep(context, '')
+            self.token = kerberos.authGSSClientResponse(context)
+            return True
 
-            f = self._opener.open(request)
-            return self.parse_response(f)
+        def authorization(self, handler, method='POST'):
+            token, self.token = self.token, None
+            return 'Negotiate {0}'.format(token) if token else None
 
 except ImportError:
     pass
@@ -154,6 +1887,7 @@ class Window(object):
         self.name = name
         self.prefix = prefix
         self.buffer = []
+        self.waiting = False
 
     @property
     def buffer_name(self):
@@ -186,11 +1920,13 @@ class Window(object):
         if self.winnr > 0:
             return False
 
-        u_vim.command(u'silent {0} {1}'.format(method, self.buffer_name))
-        u_vim.command('setlocal buftype=nofile')
-        u_vim.command('setlocal noswapfile')
-        self.buffer = vim.current.buffer
-        self.on_create()
+        with u_vim.batch():
+            u_vim.command(u'silent {0} {1}'.format(method, self.buffer_name))
+            u_vim.command('setlocal buftype=nofile')
+            u_vim.command('setlocal noswapfile')
+            self.on_create()
+            u_vim.send()
+            self.buffer = vim.current.buffer
         return True
 
     def destroy(self):
@@ -202,15 +1938,25 @@ class Window(object):
 
     @content.setter
     def content(self, text):
+        start = time.time()
         self.clear()
+        self.waiting = False
         text = u_vim.encode(text)
         self.buffer[:] = text.splitlines()
-        self.on_write()
+        with u_vim.batch():
+            self.on_write()
+        metrics.record('render', type(self).__name__, time.time() - start)
 
     def clear(self):
         self.command('setlocal modifiable')
         self.buffer[:] = []
 
+    def loading(self):
+        self.clear()
+        self.buffer[:] = ['Loading...']
+        self.command('setlocal nomodifiable')
+        self.waiting = True
+
     def on_create(self):
         pass
 
@@ -261,6 +2007,10 @@ class UI(object):
     def focus(self, window):
         self.windows[window].focus()
 
+    def loading(self, windows):
+        for window in windows:
+            self.windows[window].loading()
+
 
 class WikiUI(UI):
     def __init__(self):
@@ -272,15 +2022,15 @@ class WikiUI(UI):
         }
 
     def create(self):
-        if u_vim.eval('tracWikiStyle') == 'full':
+        if u_vim.eval('g:tracWikiStyle') == 'full':
             if self.windows['wiki'].create():
                 u_vim.command('only')
         else:
             self.windows['wiki'].create('vertical belowright new')
-        if u_vim.eval('tracWikiToC') == '1':
+        if u_vim.eval('g:tracWikiToC') == '1':
             self.windows['list'].create('vertical leftabove new')
         self.focus('wiki')
-        if u_vim.eval('tracWikiPreview') == '1':
+        if u_vim.eval('g:tracWikiPreview') == '1':
             w, h = self.windows['wiki'].size
             w = w / 2
             if w > h:
@@ -303,7 +2053,7 @@ class TicketUI(UI):
         }
 
     def create(self):
-        if u_vim.eval('tracTicketStyle') == 'full':
+        if u_vim.eval('g:tracTicketStyle') == 'full':
             if self.windows['ticket'].create('belowright new'):
                 u_vim.command('only')
             w = self.windows['ticket'].width / 2
@@ -349,10 +2099,7 @@ class PreviewWindow(NonEditableWindow):
         ])
 
     def load(self, html):
-        file_name = save_html(html)
-        self.clear()
-        self.command(u'silent r!lynx -dump {0}'.format(file_name))
-        self.on_write()
+        self.content = html_to_text(html, trac.base_url)
 
 
 class WikiListWindow(NonEditableWindow):
@@ -364,7 +2111,7 @@ class WikiListWindow(NonEditableWindow):
         u_vim.command('vertical resize 30')
 
     def on_write(self):
-        if u_vim.eval('tracHideTracWiki') == '1':
+        if u_vim.eval('g:tracHideTracWiki') == '1':
             for name in ('Trac', 'Wiki', 'InterMapTxt$', 'InterWiki$',
                          'InterTrac$', 'SandBox$', 'TitleIndex$',
                          'RecentChanges$', 'CamelCase$', 'PageTemplates$'):
@@ -376,7 +2123,10 @@ class WikiListWindow(NonEditableWindow):
 
 
 class TicketListWindow(NonEditableWindow):
+    syntax = None
+
     def on_create(self):
+        self.syntax = None
         map_commands([
             ('<cr>', '0:python trac.ticket_view("<c-r><c-w>")<cr>'),
             ('<2-LeftMouse>', '0:python trac.ticket_view("<c-r><c-w>")<cr>'),
@@ -384,31 +2134,14 @@ class TicketListWindow(NonEditableWindow):
         ])
 
     def on_write(self):
-        try:
-            u_vim.command('AlignCtrl rl+')
-            u_vim.command('%Align ||')
-        except:
-            u_vim.command('echo "install Align for the best view of summary"')
-        u_vim.command('silent %s/^\s*|| / - /g')
         super(TicketListWindow, self).on_write()
         u_vim.command('silent norm! 2gg')
-        u_vim.command('syn match Ignore /||/')
-        u_vim.command('syn match Number /\<\d*\>/')
-        u_vim.command('syn match Error /^\s*#.*$/')
-        u_vim.command('syn match Keyword /^\s-\s.*: .*$/ contains=Title')
-        u_vim.command('syn match Title /^\s-\s.*:/ contained')
-        hilighters = ['Constant', 'Special', 'Identifier', 'Statement',
-                      'PreProc', 'Type', 'Underlined']
-        num_hi = len(hilighters)
-        options = trac.ticket.options
-        for values in options.values():
-            for i, a in enumerate(values):
-                try:
-                    float(a)
-                except ValueError:
-                    hi = hilighters[i % num_hi]
-                    if u'/' not in a:
-                        u_vim.command(u'syn match {0} /\<{1}\>/'.format(hi, a))
+        key, rules = trac.ticket.get_syntax()
+        if key != self.syntax:
+            u_vim.command('syn clear')
+            for rule in rules:
+                u_vim.command(rule)
+            self.syntax = key
 
 
 class TicketWindow(NonEditableWindow):
@@ -430,21 +2163,16 @@ class TicketWindow(NonEditableWindow):
                     'contains=Identifier')
         u_vim.command('syn match Identifier /(.*)/ contained')
 
-    def load(self, wiki_text):
-        try:
-            file_name = save_html(trac.server.wiki.wikiToHtml(wiki_text))
-        except Exception as e:
-            print_error(e)
-            return
-        self.clear()
-        self.command(u'silent r!lynx -dump {0}'.format(file_name))
-        self.on_write()
-        map_commands([
-            ('<tab>', '/^\w\{3\} [0-9/]\{10\} [0-9:]\{5\} (.*)$<cr>:nohl<cr>'),
-            ('<c-]>', '/\\d*\\]\\w*<cr>:nohl<cr>'),
-            ('<cr>', 'F[l/^ *<c-r><c-w>. http<cr>fh"py$:nohl<cr>'
-                     ':python webbrowser.open("<c-r>p")<cr><c-o>'),
-        ])
+    def load(self, html):
+        self.content = html_to_text(html, trac.base_url)
+        with u_vim.batch():
+            map_commands([
+                ('<tab>', '/^\w\{3\} [0-9/]\{10\} [0-9:]\{5\} (.*)$<cr>'
+                          ':nohl<cr>'),
+                ('<c-]>', '/\\d*\\]\\w*<cr>:nohl<cr>'),
+                ('<cr>', 'F[l/^ *<c-r><c-w>. http<cr>fh"py$:nohl<cr>'
+                         ':python webbrowser.open("<c-r>p")<cr><c-o>'),
+            ])
 
 
 class TicketCommentWindow(Window):
@@ -465,12 +2193,45 @@ class SearchWindow(NonEditableWindow):
 
 
 class TimelineWindow(SearchWindow):
+    query = None
+
     def on_create(self):
+        self.query = None
         super(TimelineWindow, self).on_create()
         u_vim.command('syn match Identifier /^[0-9\-]\{10\}\s.*$/ '
                     'contains=Statement')
         u_vim.command('syn match Statement /[0-9:]\{8\}$/ contained')
 
+    def show(self, query, items, added):
+        if (query != self.query or self.winnr < 0 or
+                items[:len(added)] != added):
+            self.sizes = []
+            lines = ['Hit <enter> on a line containing :>>', '']
+            for item in items:
+                block = timeline_lines(item)
+                self.sizes.append(len(block))
+                lines.extend(block)
+            self.content = u'\n'.join(lines)
+            self.query = query
+            return True
+        if not added:
+            return False
+
+        lines = []
+        sizes = []
+        for item in added:
+            block = timeline_lines(item)
+            sizes.append(len(block))
+            lines.extend(block)
+        self.command('setlocal modifiable')
+        self.buffer[2:2] = u_vim.encode(lines)
+        self.sizes[:0] = sizes
+        while len(self.sizes) > len(items):
+            del self.buffer[-self.sizes.pop():]
+        with u_vim.batch():
+            self.on_write()
+        return True
+
 
 class ServerWindow(NonEditableWindow):
     def on_create(self):
@@ -483,6 +2244,13 @@ class ServerWindow(NonEditableWindow):
                      ':python trac.server_view()<cr>')])
 
 
+class StatsWindow(NonEditableWindow):
+    def on_create(self):
+        u_vim.command('setlocal syntax=tracwiki')
+        u_vim.command('syn match Ignore /||/')
+        map_commands([('<c-l>', ':python trac.stats_view()<cr>')])
+
+
 class AttachmentWindow(NonEditableWindow):
     def on_create(self):
         map_commands([
@@ -490,13 +2258,41 @@ class AttachmentWindow(NonEditableWindow):
 
 
 class ChangesetWindow(NonEditableWindow):
-    def load(self, changeset):
-        self.clear()
-        self.command('silent Nread {0}?format=diff'.format(changeset))
-        self.command('0d_')
-        self.command('set ft=diff')
-        self.command('silent %s/\r//g')
-        self.on_write()
+    streamed = False
+
+    def on_create(self):
+        u_vim.command('setlocal filetype=diff')
+
+    def lines(self, text):
+        return u_vim.encode([line.decode('utf-8', 'replace').rstrip(u'\r')
+                             for line in text.split('\n')])
+
+    def append(self, chunk):
+        head, sep, self.rest = (self.rest + chunk if self.streamed
+                                else chunk).rpartition('\n')
+        if not sep:
+            head = None
+        self.command('setlocal modifiable')
+        if not self.streamed:
+            self.buffer[:] = self.lines(head) if head is not None else []
+            self.streamed = True
+        elif head is not None:
+            self.buffer.append(self.lines(head))
+        u_vim.command('redraw')
+
+    def load(self, diff):
+        start = time.time()
+        if not self.streamed:
+            self.clear()
+            self.buffer[:] = self.lines(diff[:-1] if diff.endswith('\n')
+                                        else diff)
+        elif self.rest:
+            self.buffer.append(self.lines(self.rest))
+        self.streamed = False
+        self.waiting = False
+        with u_vim.batch():
+            self.on_write()
+        metrics.record('render', type(self).__name__, time.time() - start)
 
 
 class Wiki(object):
@@ -506,29 +2302,97 @@ class Wiki(object):
     def initialise(self):
         self.pages = []
         self.current = {}
+        self.completion = CompletionIndex()
+        self.index_ttl = 300
+        self._cache = None
+        self._index = None
+
+    def load_settings(self):
+        self.index_ttl = int(u_vim.eval('g:tracWikiIndexTTL'))
+        if self._cache is None:
+            self._cache = Cache(trac.server_name, 'wiki')
+            self._index = Cache(trac.server_name, 'wikiindex')
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self.load_settings()
+        return self._cache
 
     def get_all(self):
         try:
-            self.pages = trac.server.wiki.getAllPages()
+            index = self._index.get('pages')
+            now = time.time()
+            if index and now - index['fetched'] < self.index_ttl:
+                self.pages = index['pages']
+                self.completion.update(self.pages)
+                return self.pages
+            synced = datetime.datetime.utcnow() - SYNC_MARGIN
+            if index:
+                since = xmlrpclib.DateTime(index['since'])
+                changes = trac.server.wiki.getRecentChanges(since)
+                pages = set(index['pages'])
+                pages.update([c['name'] for c in changes])
+                pages = sorted(pages)
+            else:
+                pages = trac.server.wiki.getAllPages()
+            self._index.set('pages', {
+                'pages': pages,
+                'since': synced,
+                'fetched': now,
+            })
+            self.pages = pages
+            self.completion.update(self.pages)
             return self.pages
         except Exception as e:
             print_error(e)
             return []
 
-    def get(self, name):
+    def drop_page(self, name):
+        self._cache.delete(name)
+        self.completion.remove(name)
+        index = self._index.get('pages')
+        if index and name in index['pages']:
+            index['pages'] = [p for p in index['pages'] if p != name]
+            self._index.set('pages', index)
+
+    def fetch(self, name, html=False):
+        entry = self._cache.get(name)
+        info = trac.server.wiki.getPageInfo(name) if entry else None
+        if entry and entry['info']['version'] == info['version']:
+            if html and entry['html'] is None:
+                entry['html'] = trac.server.wiki.getPageHTML(name)
+                self._cache.set(name, entry)
+            return entry
+        mc = xmlrpclib.MultiCall(trac.server)
+        mc.wiki.getPage(name)
+        mc.wiki.listAttachments(name)
+        if html:
+            mc.wiki.getPageHTML(name)
+        if info is None:
+            mc.wiki.getPageInfo(name)
+        result = [c for c in mc()]
+        entry = {
+            'text': result[0],
+            'attachments': result[1],
+            'html': result[2] if html else None,
+            'info': info if info is not None else result[-1],
+        }
+        self._cache.set(name, entry)
+        return entry
+
+    def get(self, name, html=False):
         try:
             name = name.strip()
             self.attachments = []
             self.current = {'name': name}
-            mc = xmlrpclib.MultiCall(trac.server)
-            mc.wiki.getPage(name)
-            mc.wiki.getPageInfo(name)
-            mc.wiki.listAttachments(name)
-            text, info, attachments = [c for c in mc()]
-            self.current = info
-            self.attachments = attachments
+            entry = self.fetch(name, html)
+            text = entry['text']
+            self.current = entry['info']
+            self.attachments = entry['attachments']
         except xmlrpclib.Fault as e:
             if e.faultCode == 404:
+                self.drop_page(name)
                 text = u"Page doesn't exist. Describe {0} here.".format(name)
             else:
                 text = u'Error: {0}'.format(e.faultString)
@@ -537,14 +2401,19 @@ class Wiki(object):
         return text
 
     def get_html(self):
-        if not self.current.get('name'):
+        name = self.current.get('name')
+        if not name:
             return ''
+        entry = self._cache.get(name)
+        if (entry and entry['html'] is not None and
+                entry['info']['version'] == self.current.get('version')):
+            return entry['html']
         try:
-            return trac.server.wiki.getPageHTML(self.current.get('name'))
+            return trac.server.wiki.getPageHTML(name)
         except Exception as e:
             return str(e)
 
-    def save(self, comment):
+    def save(self, comment, html=False):
         try:
             info = trac.server.wiki.getPageInfo(self.current.get('name'))
             if (get_time(info['lastModified']) >
@@ -558,9 +2427,11 @@ class Wiki(object):
                 return False
         if not comment:
             comment = trac.default_comment
+        self.plan_view(self.current.get('name'), html)
         try:
             trac.server.wiki.putPage(self.current.get('name'),
                 trac.wiki_content, {'comment': comment})
+            self.cache.delete(self.current.get('name'))
             return True
         except xmlrpclib.Fault as e:
             u_vim.command('echoerr "Not committing the changes."')
@@ -569,12 +2440,21 @@ class Wiki(object):
             print_error(e)
         return False
 
+    def plan_view(self, name, html=False):
+        for method in ('wiki.getPage', 'wiki.listAttachments'):
+            trac.server.defer(method, name)
+        if html:
+            trac.server.defer('wiki.getPageHTML', name)
+        trac.server.defer('wiki.getPageInfo', name)
+
     def add_attachment(self, file):
         file_name = os.path.basename(file)
         path = u'{0}/{1}'.format(self.current.get('name'), file_name)
-        attachment = xmlrpclib.Binary(open(file).read())
+        progress = Progress(u'Uploading {0}'.format(file_name))
         try:
-            trac.server.wiki.putAttachment(path, attachment)
+            trac.server.upload('wiki.putAttachment', (path, ), file,
+                               progress.update)
+            self.cache.delete(self.current.get('name'))
             return True
         except Exception as e:
             print_error(e)
@@ -582,52 +2462,121 @@ class Wiki(object):
 
     def get_attachment(self, file):
         try:
-            buffer = trac.server.wiki.getAttachment(file)
-            save_buffer(buffer.data, file)
-            return True
+            return save_attachment('wiki.getAttachment', (file, ), file)
         except Exception as e:
             print_error(e)
             return False
 
-    def get_options(self):
+    def complete(self, text):
         if not self.pages:
+            self.load_settings()
             self.get_all()
-
-        pages = u_vim.encode(self.pages)
-        u_vim.command('let g:tracOptions={0}'.format(pages))
+        complete(self.completion, text)
 
 
 class Ticket(object):
+    generated = None
+
     def __init__(self):
-        self.fields = []
-        self.options = {}
         self.initialise()
 
     def initialise(self):
-        self._delete_vim_commands()
         self.current = {}
         self.fields = []
         self.options = {}
         self.actions = []
         self.tickets = []
         self.sorter = {
-            'order': u_vim.eval('tracTicketOrder'),
-            'group': u_vim.eval('tracTicketGroup'),
+            'order': u_vim.eval('g:tracTicketOrder'),
+            'group': u_vim.eval('g:tracTicketGroup'),
         }
         self.filters = {}
         self.page = 1
         self.total_pages = 0
         self.attachments = []
+        self.last_query = None
+        self.last_ids = []
+        self.counts = {}
+        self.queries = {}
+        self.clause = u_vim.eval('g:tracTicketClause')
+        self.incremental = True
+        self.chunk_size = 0
+        self.chunk_workers = 1
+        self.widths = {}
+        self.syntax = None
+        self.mirror = None
+        self.completions = {}
+        self.fields_ttl = 3600
+        self._cache = None
+        self._syntax_cache = None
+        self._schema_cache = None
+
+    def load_settings(self):
+        self.clause = u_vim.eval('g:tracTicketClause')
+        self.fields_ttl = int(u_vim.eval('g:tracTicketFieldsTTL'))
+        self.incremental = u_vim.eval('g:tracTicketIncremental') == '1'
+        self.chunk_size = int(u_vim.eval('g:tracTicketChunkSize'))
+        self.chunk_workers = int(u_vim.eval('g:tracTicketChunkWorkers'))
+        widths = u_vim.eval('g:tracTicketColumnWidths')
+        self.widths = dict([(k.lower(), int(v)) for k, v in widths.items()])
+        if u_vim.eval('g:tracMirror') != '1':
+            self.mirror = None
+        elif self.mirror is None:
+            self.mirror = Mirror(trac.server_name)
+        if self._cache is None:
+            self._cache = Cache(trac.server_name, 'ticket')
+            self._syntax_cache = Cache(trac.server_name, 'syntax')
+            self._schema_cache = Cache(trac.server_name, 'schema')
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = Cache(trac.server_name, 'ticket')
+        return self._cache
+
+    def get_syntax(self):
+        if self.syntax is None:
+            schema = repr(sorted(self.options.items())).encode('utf-8')
+            key = hashlib.md5(schema).hexdigest()
+            if self._syntax_cache is None:
+                self._syntax_cache = Cache(trac.server_name, 'syntax')
+            rules = self._syntax_cache.get(key)
+            if rules is None:
+                rules = syntax_rules(self.options)
+                self._syntax_cache.set(key, rules)
+            self.syntax = (u'{0}:{1}'.format(trac.server_name, key), rules)
+        return self.syntax
 
     def get_fields(self):
         if self.fields:
             return
-        try:
-            fields = trac.server.ticket.getTicketFields()
-        except Exception as e:
-            print_error(e)
-            return
+        if self._schema_cache is None:
+            self._schema_cache = Cache(trac.server_name, 'schema')
+        schema = self._schema_cache.get('fields')
+        if schema and time.time() - schema['checked'] < self.fields_ttl:
+            fields = schema['fields']
+        else:
+            try:
+                fields = trac.server.ticket.getTicketFields()
+                self._schema_cache.set('fields', {
+                    'fields': fields,
+                    'checked': time.time(),
+                })
+                if self.mirror:
+                    self.mirror.set_meta('fields', fields)
+            except Exception as e:
+                if schema:
+                    fields = schema['fields']
+                elif self.mirror:
+                    fields = self.mirror.get_meta('fields')
+                else:
+                    fields = None
+                if not fields:
+                    print_error(e)
+                    return
         self.options = {}
+        self.completions = {}
+        self.syntax = None
         self.fields = fields
         for f in fields:
             if 'options' in f:
@@ -635,8 +2584,9 @@ class Ticket(object):
         self.max_label_width = max([len(f['label']) for f in self.fields])
         self._generate_vim_commands()
 
-    def _delete_vim_commands(self):
-        for t in self.options.get('type', []):
+    def _delete_vim_commands(self, fields):
+        options = dict([(f['name'], f.get('options', [])) for f in fields])
+        for t in options.get('type', []):
             name = t.title()
             name = ''.join(re.findall(r'[a-zA-z0-9]*', name))
             u_vim.command(u'delc TTCreate{0}'.format(name))
@@ -648,14 +2598,22 @@ class Ticket(object):
                 delf Com{1}
             endif
         """
-        for f in self.fields:
+        for f in fields:
             mname = f['name'].title()
             mname = u''.join(re.findall('[a-zA-Z0-9]*', mname))
             for s in ('Update', 'Filter', 'Ignore'):
                 u_vim.command(delcommand.format(s, mname))
 
     def _generate_vim_commands(self):
-        for t in self.options['type']:
+        schema = json.dumps(self.fields, sort_keys=True)
+        key = hashlib.md5(schema).hexdigest()
+        if Ticket.generated is not None:
+            if Ticket.generated[0] == key:
+                return
+            self._delete_vim_commands(Ticket.generated[1])
+        Ticket.generated = (key, self.fields)
+
+        for t in self.options.get('type', []):
             name = t.title()
             name = u''.join(re.findall('[a-zA-z0-9]*', name))
             name = u'TTCreate{0}'.format(name)
@@ -664,9 +2622,8 @@ class Ticket(object):
 
         compfun = u"""
             fun! Com{0}(A, L, P)
-                python trac.ticket.get_options('{1}')
-                let l:comp = 'v:val =~ "^' . a:A . '"'
-                return filter(g:tracOptions, l:comp)
+                python trac.ticket.complete(vim.eval('a:A'), '{1}')
+                return g:tracOptions
             endfun
         """
 
@@ -699,10 +2656,11 @@ class Ticket(object):
     def set_sort_attr(self, attrib, value):
         self.sorter[attrib] = value
 
-    def query_string(self, f_all=False):
-        query = u'order={order}&group={group}&page={page}'
-        query = query.format(page=self.page, **self.sorter)
-        query = u'{0}&{1}'.format(query, u_vim.eval('tracTicketClause'))
+    def query_string(self, f_all=False, page=None):
+        query = u'order={order}&group={group}'.format(**self.sorter)
+        if not f_all:
+            query = u'{0}&page={1}'.format(query, page or self.page)
+        query = u'{0}&{1}'.format(query, self.clause)
         filters = [u'{0}={1}'.format(k, v) for k, v in
                     self.filters.iteritems()]
         if filters:
@@ -711,77 +2669,279 @@ class Ticket(object):
             query = u'{0}&max=0'.format(query)
         return query
 
+    @property
+    def tickets_per_page(self):
+        res = re.search(u'max=(\d*)', self.clause)
+        return int(res.group(1) or 0) if res else 100
+
+    def needs_count(self, query, shown, stale=False):
+        per_page = self.tickets_per_page
+        if not per_page or (query in self.counts and not stale):
+            return False
+        return not (shown < per_page and (shown or self.page == 1))
+
+    def count_tickets(self):
+        query = self.query_string(True)
+        per_page = self.tickets_per_page
+        shown = len(self.tickets)
+        if self.needs_count(query, shown):
+            self.counts[query] = len(trac.server.ticket.query(query))
+        elif not per_page:
+            self.counts[query] = shown
+        elif shown < per_page and (shown or self.page == 1):
+            self.counts[query] = (self.page - 1) * per_page + shown
+        total = self.counts[query]
+        per_page = per_page or total or 1
+        self.total_pages = (total + per_page - 1) // per_page
+        return total
+
     @property
     def number_tickets(self):
         try:
-            total = len(trac.server.ticket.query(self.query_string(True)))
+            return self.count_tickets()
         except Exception as e:
             print_error(e)
             self.total_pages = 0
             return 0
-        max_regex = re.compile(u'max=(\d*)')
-        res = max_regex.search(self.query_string())
-        if res:
-            tickets_per_page = res.groups()[0]
-            if tickets_per_page == '0':
-                tickets_per_page = total
-        else:
-            tickets_per_page = 100
-        tp = total / float(tickets_per_page)
-        if int(tp) < tp:
-            tp += 1
-        self.total_pages = int(tp)
-        return total
 
-    def get_all(self):
-        multicall = xmlrpclib.MultiCall(trac.server)
+    def plan_query(self, changed=False):
+        if self.mirror or not self.incremental:
+            return
+        query = self.query_string()
+        since = self.cache.get('since')
+        if since is not None:
+            trac.server.defer('ticket.getRecentChanges',
+                              xmlrpclib.DateTime(since))
+        if changed or since is None or (query != self.last_query and
+                                        query not in self.queries):
+            trac.server.defer('ticket.query', query)
+        total = self.query_string(True)
+        if query == self.last_query and self.needs_count(
+                total, len(self.last_ids), changed):
+            trac.server.defer('ticket.query', total)
+
+    def query_tickets(self, query):
+        if not self.incremental:
+            return trac.server.ticket.query(query), {}
+
+        since = self.cache.get('since')
+        if since is None:
+            ids = trac.server.ticket.query(query)
+            self.cache.set('since', datetime.datetime.utcnow() - SYNC_MARGIN)
+        else:
+            if query == self.last_query:
+                known = self.last_ids
+            else:
+                known = self.queries.get(query)
+            mc = xmlrpclib.MultiCall(trac.server)
+            mc.ticket.getRecentChanges(xmlrpclib.DateTime(since))
+            if known is None:
+                mc.ticket.query(query)
+            result = [c for c in mc()]
+            ids = result[1] if len(result) > 1 else known
+            if result[0]:
+                ids = self.apply_changes(since, result[0], query,
+                                         ids if len(result) > 1 else None)
+        self.last_query, self.last_ids = query, ids
+
+        cached = {}
+        if since is not None:
+            for tid in ids:
+                entry = self.cache.get(tid)
+                if entry:
+                    cached[tid] = entry['ticket']
+        return ids, cached
+
+    def apply_changes(self, since, changed, query, ids):
+        mc = xmlrpclib.MultiCall(trac.server)
+        for tid in changed:
+            mc.ticket.get(tid)
+        if ids is None:
+            mc.ticket.query(query)
+        result = mc()
+        modified = False
+        for i, tid in enumerate(changed):
+            try:
+                ticket = result[i]
+            except xmlrpclib.Fault:
+                self.cache.delete(tid)
+                modified = True
+                continue
+            entry = self.cache.get(tid)
+            token = ticket[3].get('_ts') or str(ticket[2])
+            if not entry or entry['_ts'] != token:
+                self.cache_ticket(ticket)
+                modified = True
+            since = max(since, get_time(ticket[2]) +
+                        datetime.timedelta(seconds=1))
+        self.cache.set('since', since)
+        if modified:
+            self.counts = {}
+            self.queries = {}
+        return result[len(changed)] if ids is None else ids
+
+    def query_mirror(self):
         try:
-            for ticket in trac.server.ticket.query(self.query_string()):
-                multicall.ticket.get(ticket)
-        except Exception as e:
-            return u' || Error: {0}'.format(e)
-        tickets = multicall()
-        self.tickets = tickets
-
+            for tid in self.mirror.sync():
+                self.cache.delete(tid)
+        except (socket.error, xmlrpclib.ProtocolError):
+            pass
+        result = self.mirror.query(self.query_string(), self.options)
+        if result is None:
+            return None
+        total, tickets = result
+        self.counts[self.query_string(True)] = total
+        return tickets
+
+    def fetch_chunk(self, ids):
+        server = trac.server
+        with server.batch.active(None):
+            multicall = xmlrpclib.MultiCall(server)
+            for tid in ids:
+                multicall.ticket.get(tid)
+            return [ticket for ticket in multicall()]
+
+    def fetch_tickets(self, ids, arrived=None):
+        size = self.chunk_size or len(ids) or 1
+        chunks = [ids[i:i + size] for i in range(0, len(ids), size)]
+        tickets = []
+        fetch = trac.bound().bind(self.fetch_chunk)
+        for chunk in trac.pool.imap(fetch, chunks, self.chunk_workers):
+            tickets.extend(chunk)
+            if arrived is not None:
+                arrived(chunk)
+        return tickets
+
+    def query_server(self, progress=None):
+        ids, cached = self.query_tickets(self.query_string())
+        tickets = dict(cached)
+
+        def arrived(chunk):
+            for ticket in chunk:
+                self.cache_ticket(ticket)
+                tickets[ticket[0]] = ticket
+            if progress is not None:
+                shown = itertools.takewhile(lambda t: t in tickets, ids)
+                progress(([tickets[tid] for tid in shown], len(ids)))
+
+        self.fetch_tickets([tid for tid in ids if tid not in cached],
+                           arrived)
+        return [tickets[tid] for tid in ids]
+
+    def format_tickets(self, tickets):
         columns = ['#', 'summary']
         columns.extend(self.options.keys())
         columns.extend(['owner', 'reporter'])
         if 'resolution' in columns:
             columns.remove('resolution')
 
-        tlist = [u' || '.join([c.title() for c in columns])]
+        rows = [[c.title() for c in columns]]
+        for ticket in tickets:
+            str_ticket = [unicode(ticket[0]),
+                          truncate_words(ticket[3]['summary'])]
+            for f in columns[2:]:
+                str_ticket.append(ticket[3].get(f, u''))
+            rows.append(str_ticket)
+        return align_columns(rows, [self.widths.get(c) for c in columns])
+
+    def get_all(self, progress=None):
         try:
-            for ticket in tickets:
-                str_ticket = [str(ticket[0]),
-                              truncate_words(ticket[3]['summary'])]
-                for f in columns[2:]:
-                    str_ticket.append(ticket[3].get(f, ''))
-                tlist.append(u' || '.join(str_ticket))
+            tickets = self.query_mirror() if self.mirror else None
+            if tickets is not None:
+                for ticket in tickets:
+                    self.cache_ticket(ticket)
+            else:
+                tickets = self.query_server(progress)
         except Exception as e:
-            return u' || Error: {0}'.format(e)
+            return u' - Error: {0}'.format(e)
+        self.tickets = tickets
 
-        skey = u' || {0}: {1}'
+        try:
+            tlist = self.format_tickets(tickets)
+        except Exception as e:
+            return u' - Error: {0}'.format(e)
+
+        skey = u' - {0}: {1}'
         tlist.append('')
         for k, v in self.sorter.iteritems():
             tlist.append(skey.format(k.title(), self.get_label(v)))
         for k, v in self.filters.iteritems():
             tlist.append(skey.format(k.title(), self.get_label(v)))
 
-        tlist.extend([skey.format('Other', u_vim.eval('tracTicketClause')),
+        tlist.extend([skey.format('Other', self.clause),
             '', skey.format('Number of tickets', self.number_tickets),
-            ' || {0}: {1} of {2}'.format('Page', self.page, self.total_pages)])
+            skey.format('Page', u'{0} of {1}'.format(self.page,
+                                                     self.total_pages))])
         tlist.append('')
         return u'\n'.join(tlist)
 
+    def cache_ticket(self, ticket, changelog=None, attachments=None,
+                     actions=None):
+        token = ticket[3].get('_ts') or str(ticket[2])
+        entry = self.cache.get(ticket[0])
+        if changelog is None and entry and entry['_ts'] == token:
+            changelog = entry['changelog']
+            attachments = entry.get('attachments')
+            actions = entry.get('actions')
+        self.cache.set(ticket[0], {
+            '_ts': token,
+            'ticket': ticket,
+            'changelog': changelog,
+            'attachments': attachments,
+            'actions': actions,
+        })
+
+    def has_details(self, entry):
+        return (entry and entry['changelog'] is not None and
+                entry.get('actions') is not None)
+
+    def fetch(self, tid):
+        entry = self.cache.get(tid)
+        complete = self.has_details(entry)
+        mc = xmlrpclib.MultiCall(trac.server)
+        mc.ticket.get(tid)
+        mc.ticket.listAttachments(tid)
+        if not complete:
+            mc.ticket.getActions(tid)
+            mc.ticket.changeLog(tid)
+        result = [c for c in mc()]
+        ticket, attachments = result[:2]
+        if not complete:
+            actions, changelog = result[2:]
+        elif entry['_ts'] == (ticket[3].get('_ts') or str(ticket[2])):
+            actions, changelog = entry['actions'], entry['changelog']
+        else:
+            mc = xmlrpclib.MultiCall(trac.server)
+            mc.ticket.getActions(tid)
+            mc.ticket.changeLog(tid)
+            actions, changelog = [c for c in mc()]
+        self.cache_ticket(ticket, changelog, attachments, actions)
+        return ticket, changelog, attachments, actions
+
+    def prefetch(self, tid):
+        if self.has_details(self.cache.get(tid)):
+            return 0
+        result = self.fetch(tid)
+        return len(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+
+    def prefetch_page(self, query):
+        if query in self.queries:
+            return 0
+        ids = trac.server.ticket.query(query)
+        mc = xmlrpclib.MultiCall(trac.server)
+        for tid in ids:
+            if not self.cache.get(tid):
+                mc.ticket.get(tid)
+        tickets = [t for t in mc()]
+        for ticket in tickets:
+            self.cache_ticket(ticket)
+        self.queries[query] = ids
+        return len(pickle.dumps(tickets, pickle.HIGHEST_PROTOCOL))
+
     def get(self, tid):
         try:
             tid = int(tid)
-            mc = xmlrpclib.MultiCall(trac.server)
-            mc.ticket.get(tid)
-            mc.ticket.changeLog(tid)
-            mc.ticket.listAttachments(tid)
-            mc.ticket.getActions(tid)
-            ticket, changelog, attachments, actions = [c for c in mc()]
+            ticket, changelog, attachments, actions = self.fetch(tid)
             self.current = {
                 'id': tid,
                 '_ts': ticket[3].get('_ts'),
@@ -833,39 +2993,54 @@ class Ticket(object):
         sticket.extend([' - {0}'.format(action[0]) for action in actions])
         return u'\n'.join(sticket)
 
-    def update(self, comment, attribs={}, notify=False):
+    def update(self, comment, attribs=None, notify=False):
+        attribs = dict(attribs or {})
+        if self.current.get('_ts'):
+            attribs['_ts'] = self.current['_ts']
         try:
-            if self.current.get('_ts'):
-                attribs['_ts'] = self.current['_ts']
-            return trac.server.ticket.update(self.current['id'], comment,
-                                             attribs, notify)
+            ticket = trac.server.ticket.update(self.current['id'], comment,
+                                               attribs, notify)
+            self.cache.delete(self.current['id'])
+            self.counts = {}
+            self.queries = {}
+            return ticket
         except xmlrpclib.Fault as e:
             u_vim.command('echoerr "Not committing the changes."')
             u_vim.command(u'echoerr "Error: {0}"'.format(e.faultString))
         return None
 
+    def plan_view(self, tid):
+        for method in ('ticket.get', 'ticket.listAttachments',
+                       'ticket.getActions', 'ticket.changeLog'):
+            trac.server.defer(method, tid)
+        self.plan_query(True)
+
     def create(self, description, summary, attributes={}):
         try:
-            return trac.server.ticket.create(summary, description, attributes)
+            tid = trac.server.ticket.create(summary, description, attributes)
+            self.counts = {}
+            self.queries = {}
+            return tid
         except Exception as e:
             print_error(e)
             return None
 
     def get_attachment(self, file):
         try:
-            buffer = trac.server.ticket.getAttachment(self.current.get('id'),
-                                                      file)
-            save_buffer(buffer.data, file)
-            return True
+            return save_attachment('ticket.getAttachment',
+                                   (self.current.get('id'), file), file)
         except Exception as e:
             print_error(e)
             return False
 
     def add_attachment(self, file, comment=''):
         file_name = os.path.basename(file)
+        progress = Progress(u'Uploading {0}'.format(file_name))
         try:
-            trac.server.ticket.putAttachment(self.current.get('id'), file_name,
-                comment, xmlrpclib.Binary(open(file).read()))
+            trac.server.upload('ticket.putAttachment',
+                               (self.current.get('id'), file_name, comment),
+                               file, progress.update)
+            self.cache.delete(self.current.get('id'))
             return True
         except Exception as e:
             print_error(e)
@@ -889,7 +3064,11 @@ class Ticket(object):
         action = action.split()
         try:
             name, options = action[0], action[1:]
-            actions = trac.server.ticket.getActions(self.current.get('id'))
+            entry = self.cache.get(self.current.get('id'))
+            if entry and entry.get('actions') is not None:
+                actions = entry['actions']
+            else:
+                actions = trac.server.ticket.getActions(self.current['id'])
         except IndexError:
             u_vim.command('echoerr "No action requested"')
             return
@@ -916,20 +3095,31 @@ class Ticket(object):
                 return
         return self.update(comment, attribs)
 
-    def get_options(self, key='type', type_='attrib'):
-        options = {
-            'attrib': self.options.get(key, []),
-            'field': self.options.keys(),
-            'action': self.actions,
-            'history': map(str, trac.history['ticket']),
-        }.get(type_, [])
-        options = u_vim.encode(options)
-        u_vim.command('let g:tracOptions={0}'.format(options))
-
-
-def search(search_pattern):
+    def complete(self, text, key='type', type_='attrib'):
+        index = self.completions.get((type_, key))
+        if index is None:
+            options = {
+                'attrib': self.options.get(key, []),
+                'field': self.options.keys(),
+                'action': self.actions,
+                'history': map(str, trac.history['ticket']),
+            }.get(type_, [])
+            index = CompletionIndex(options)
+            if type_ in ('attrib', 'field'):
+                self.completions[(type_, key)] = index
+        complete(index, text)
+
+
+def search(search_pattern, mirror=None):
     try:
-        a_search = trac.server.search.performSearch(search_pattern)
+        if mirror:
+            try:
+                mirror.sync()
+            except (socket.error, xmlrpclib.ProtocolError):
+                pass
+            a_search = mirror.search(search_pattern)
+        else:
+            a_search = trac.server.search.performSearch(search_pattern)
     except Exception as e:
         return u'Error: {0}'.format(e)
     result = [
@@ -949,13 +3139,12 @@ def search(search_pattern):
     return u'\n'.join(result)
 
 
-def timeline(server, on=None, author=None):
+def timeline(server, cache, on=None, author=None, max_entries=50):
     try:
         import feedparser
-        from time import strftime
     except ImportError:
         u_vim.command('echoerr "Please install feedparser.py!"')
-        return
+        return [], []
 
     parse_kwargs = {}
     if server['auth_type'] == Trac.KERBEROS_AUTH:
@@ -965,7 +3154,7 @@ def timeline(server, on=None, author=None):
         except NameError:
             pass
 
-    query = 'max={0}&format=rss'.format(u_vim.eval('tracTimelineMax'))
+    query = 'max={0}&format=rss'.format(max_entries)
     if on in ('wiki', 'ticket', 'changeset'):
         query = '{0}=on&{1}'.format(on, query)
     elif not author:
@@ -973,29 +3162,57 @@ def timeline(server, on=None, author=None):
     if author:
         query = u'authors={0}&{1}'.format(author, query)
     feed = u'{scheme}://{server}/timeline?{q}'.format(q=query, **server)
-    d = feedparser.parse(feed, **parse_kwargs)
-    str_feed = ['Hit <enter> on a line containing :>>', '']
+    entry = cache.get(feed) or {'etag': None, 'modified': None, 'items': []}
+    d = feedparser.parse(feed, etag=entry['etag'],
+                         modified=entry['modified'], **parse_kwargs)
+    if d.get('status') == 304 or not d['items']:
+        return entry['items'], []
+
+    known = set([item['id'] for item in entry['items']])
+    items = list(entry['items'])
     for item in d['items']:
-        str_feed.append(strftime(u'%Y-%m-%d %H:%M:%S', item.updated_parsed))
-
-        if 'ticket' in item.category:
-            m = re.match(r'^Ticket #(\d+)', item.title)
-            if m:
-                str_feed.append('Ticket:>> {0}'.format(m.group(1)))
-        if 'wiki' in item.category:
-            str_feed.append('Wiki:>> {0}'.format(item.title.split(' ', 1)[0]))
-        if 'changeset' in item.category:
-            m = re.match(r'^Changeset .*\[(\w+)\]:', item.title)
-            if m:
-                str_feed.append('Changeset:>> {0}'.format(m.group(1)))
-
-        str_feed.append(item.title)
-        if item.get('author'):
-            str_feed.append(u'Author: {0}'.format(item.author))
-        str_feed.append(u'Link: {0}'.format(item.link))
-        str_feed.append('')
-
-    return u'\n'.join(str_feed)
+        key = item.get('id') or u'{0} {1}'.format(item.link, item.title)
+        if key not in known:
+            known.add(key)
+            items.append({
+                'id': key,
+                'updated': tuple(item.updated_parsed),
+                'category': item.get('category', u''),
+                'title': item.title,
+                'author': item.get('author'),
+                'link': item.link,
+                'new': True,
+            })
+    items.sort(key=lambda i: i['updated'], reverse=True)
+    items = items[:int(max_entries)]
+    added = [item for item in items if item.pop('new', False)]
+    cache.set(feed, {
+        'etag': d.get('etag'),
+        'modified': d.get('modified'),
+        'items': items,
+    })
+    return items, added
+
+
+def timeline_lines(item):
+    lines = [time.strftime(u'%Y-%m-%d %H:%M:%S', item['updated'])]
+    if 'ticket' in item['category']:
+        m = re.match(r'^Ticket #(\d+)', item['title'])
+        if m:
+            lines.append('Ticket:>> {0}'.format(m.group(1)))
+    if 'wiki' in item['category']:
+        lines.append('Wiki:>> {0}'.format(item['title'].split(' ', 1)[0]))
+    if 'changeset' in item['category']:
+        m = re.match(r'^Changeset .*\[(\w+)\]:', item['title'])
+        if m:
+            lines.append('Changeset:>> {0}'.format(m.group(1)))
+
+    lines.append(item['title'])
+    if item['author']:
+        lines.append(u'Author: {0}'.format(item['author']))
+    lines.append(u'Link: {0}'.format(item['link']))
+    lines.append('')
+    return lines
 
 
 class Trac(object):
@@ -1003,20 +3220,26 @@ class Trac(object):
     DIGEST_AUTH = 'digest'
     KERBEROS_AUTH = 'kerberos'
     USER_AGENT = u'Vitra 1.3 (Trac client for Vim)'
+    STATE = ('server_url', 'batch', 'connections', 'wiki', 'ticket',
+             'history', 'timeline_cache', 'changeset_cache', 'view')
 
     def __init__(self):
-        self.wiki = Wiki()
-        self.ticket = Ticket()
+        self.executor = Executor()
+        self.prefetcher = Prefetcher()
+        self.pool = WorkerPool()
 
         self.uiwiki = WikiUI()
         self.uiticket = TicketUI()
 
         self.server_window = ServerWindow(prefix='Trac', name='Servers')
         self.timeline_window = TimelineWindow(prefix='Timeline')
+        self.stats_window = StatsWindow(prefix='Trac', name='Statistics')
 
-        self.default_comment = u_vim.eval('tracDefaultComment')
-        self.server = u_vim.eval('tracDefaultServer')
-        self.history = {'wiki': [], 'ticket': []}
+        self.default_comment = u_vim.eval('g:tracDefaultComment')
+        self.server_name = None
+        self.states = collections.OrderedDict()
+        self.server = u_vim.eval('g:tracDefaultServer')
+        self.crossings = {}
 
     @property
     def wiki_content(self):
@@ -1026,18 +3249,52 @@ class Trac(object):
     def ticket_content(self):
         return self.uiticket.windows['edit'].content
 
+    @property
+    def base_url(self):
+        return u'{scheme}://{server}/'.format(**self.server_url)
+
     @property
     def server(self):
-        return self._server
+        return self.bound().get()
 
     @server.setter
     def server(self, server):
-        self.clear()
-        server_list = u_vim.eval('tracServerList')
+        server_list = u_vim.eval('g:tracServerList')
         if not server:
             server = server_list.keys()[0]
         url = server_list[server]
+        previous = self.server_name
+        if previous is not None:
+            view = self.save_view()
+            self.clear()
+            if previous != server:
+                self.states[previous] = dict([(k, getattr(self, k))
+                                              for k in self.STATE])
+                self.states[previous]['snapshot'] = view
+            else:
+                self.disconnect()
         self.server_name = server
+
+        state = self.states.pop(server, None)
+        limit = max(int(u_vim.eval('g:tracServerStates')), 1)
+        while len(self.states) >= limit:
+            name, evicted = self.states.popitem(last=False)
+            self.disconnect(evicted)
+
+        if state is not None:
+            snapshot = state.pop('snapshot')
+            for key, value in state.items():
+                setattr(self, key, value)
+            if self.ticket.fields:
+                self.ticket._generate_vim_commands()
+            if snapshot is not None:
+                self.restore_view(snapshot)
+            return
+
+        self.wiki = Wiki()
+        self.ticket = Ticket()
+        self.history = {'wiki': [], 'ticket': []}
+        self.view = None
         self.server_url = {
             'scheme': url.get('scheme', 'http'),
             'server': url['server'],
@@ -1045,38 +3302,77 @@ class Trac(object):
             'auth': url.get('auth', ''),
             'auth_type': url.get('auth_type', self.BASIC_AUTH),
         }
-        auth = self.server_url['auth'].split(':')
-        auth_type = self.server_url['auth_type']
+        self.batch = RPCBatch()
+        self.connections = Connections(functools.partial(
+            self.connect, self.server_url, self.batch))
+        self.timeline_cache = Cache(server, 'timeline')
+        self.changeset_cache = Cache(server, 'changeset', keep=False)
+
+    def disconnect(self, state=None):
+        connections = state['connections'] if state else self.connections
+        connections.close()
+
+    def bind(self, job):
+        return self.connections.bind(job)
+
+    def bound(self):
+        return getattr(BOUND, 'connections', None) or self.connections
+
+    def connect(self, server_url, batch):
+        auth = server_url['auth']
+        auth_type = server_url['auth_type']
+        url = '{scheme}://{server}{rpc_path}'
 
         if auth_type == self.BASIC_AUTH:
-            url = '{scheme}://{auth}@{server}{rpc_path}'
-            transport = None
+            transport = HTTPBasicTransport(server_url['scheme'], auth)
         elif auth_type == self.DIGEST_AUTH:
-            url = '{scheme}://{server}{rpc_path}'
-            transport = HTTPDigestTransport(self.server_url['scheme'], *auth)
+            transport = HTTPDigestTransport(server_url['scheme'],
+                                            *auth.split(':'))
         elif auth_type == self.KERBEROS_AUTH:
-            url = '{scheme}://{server}{rpc_path}'
             try:
-                transport = HTTPKerberosTransport(self.server_url['scheme'])
+                transport = HTTPKerberosTransport(server_url['scheme'])
             except NameError:
                 print_error('Kerberos Authentication method needs '
                             'the module urllib2_kerberos to be installed. '
                             'See http://pypi.python.org/pypi/urllib2_kerberos')
-                return
+                return None
         else:
             print_error('Authentication method {0} '
                         'is not supported yet'.format(auth_type))
-            return
-        self._server = xmlrpclib.ServerProxy(url.format(**self.server_url),
-                                            transport=transport)
-        self._server.__transport.user_agent = self.USER_AGENT
+            return None
+        transport.user_agent = self.USER_AGENT
+        return ServerProxy(url.format(**server_url), transport, batch)
+
+    def wiki_to_html(self, text, render='auto'):
+        if render == 'server' or (render == 'auto' and
+                                  WikiFormatter.needs_server(text)):
+            return self.server.wiki.wikiToHtml(text)
+        return wiki_to_html(text, self.base_url)
 
     def clear(self):
-        self.wiki.initialise()
-        self.ticket.initialise()
+        for channel in ('wiki', 'ticket', 'search', 'timeline', 'changeset'):
+            self.executor.cancel(channel)
+        self.prefetcher.cancel()
         self.uiwiki.destroy()
         self.uiticket.destroy()
 
+    def save_view(self):
+        if self.view is None:
+            return None
+        ui = self.uiwiki if self.view == 'wiki' else self.uiticket
+        windows = [(n, w) for n, w in ui.windows.items() if w.winnr > 0]
+        if not windows:
+            return None
+        return (self.view, dict([(n, w.content) for n, w in windows]),
+                dict([(n, w.name) for n, w in windows]))
+
+    def restore_view(self, view):
+        name, contents, titles = view
+        ui = self.uiwiki if name == 'wiki' else self.uiticket
+        ui.create()
+        ui.update(contents, titles)
+        ui.focus(name)
+
     def set_history(self, type_, page):
         if page and page not in self.history[type_]:
             self.history[type_].append(page)
@@ -1091,26 +3387,42 @@ class Trac(object):
             page = self.history[type_][0]
         return page
 
-    def wiki_view(self, page=False, direction=None):
+    def wiki_view(self, page=False, direction=None, session=None):
         page = page if page else self.wiki.current.get('name', 'WikiStart')
         page = self.traverse_history('wiki', page, direction)
-
-        contents = {
-            'wiki': self.wiki.get(page),
-            'attachment': u'\n'.join(self.wiki.attachments),
-        }
-        titles = {'wiki': page}
-        if u_vim.eval('tracWikiToC') == '1':
-            contents['list'] = u'\n'.join(self.wiki.get_all())
-
-        self.uiwiki.create()
-        self.uiwiki.update(contents, titles)
-        if u_vim.eval('tracWikiPreview') == '1':
-            self.uiwiki.windows['preview'].load(self.wiki.get_html())
-        self.uiwiki.focus('wiki')
-        self.set_history('wiki', page)
-
-    def ticket_view(self, tid=None, direction=None):
+        toc = u_vim.eval('g:tracWikiToC') == '1'
+        preview = u_vim.eval('g:tracWikiPreview') == '1'
+        self.wiki.load_settings()
+        wiki = self.wiki
+
+        def fetch():
+            contents = {
+                'wiki': wiki.get(page, preview),
+                'attachment': u'\n'.join(wiki.attachments),
+            }
+            if toc:
+                contents['list'] = u'\n'.join(wiki.get_all())
+            html = wiki.get_html() if preview else None
+            return contents, html
+
+        def render(result):
+            contents, html = result
+            self.uiwiki.create()
+            self.uiwiki.update(contents, {'wiki': page})
+            if html is not None:
+                self.uiwiki.windows['preview'].load(html)
+            self.uiwiki.focus('wiki')
+            self.set_history('wiki', page)
+            self.view = 'wiki'
+
+        if self.executor.enabled:
+            self.uiwiki.create()
+            self.uiwiki.loading(['wiki', 'preview'] if preview else ['wiki'])
+            self.uiwiki.focus('wiki')
+        self.executor.submit('wiki', self.batched(fetch, session),
+                             self.measure('wiki', render))
+
+    def ticket_view(self, tid=None, direction=None, session=None):
         try:
             tid = int(tid) if tid else self.ticket.current.get('id')
             tid = self.traverse_history('ticket', tid, direction)
@@ -1118,36 +3430,141 @@ class Trac(object):
             print('Please provide a valid ticket id')
             return
 
+        self.ticket.load_settings()
         self.ticket.get_fields()
-        contents = {
-            'ticket': self.ticket.get(tid),
-            'edit': '',
-            'attachment': '\n'.join(self.ticket.attachments),
-        }
-        titles = {'ticket': '#{0}'.format(tid) if tid else ''}
-        if u_vim.eval('tracTicketStyle') == 'full':
-            contents['list'] = self.ticket.get_all()
-            titles['list'] = 'Page {0} of {1}'.format(self.ticket.page,
-                                                      self.ticket.total_pages)
-        self.uiticket.create()
-        self.uiticket.update(contents, titles)
-        if tid:
-            self.uiticket.focus('ticket')
-            if u_vim.eval('tracTicketFormat') == '1':
+        full = u_vim.eval('g:tracTicketStyle') == 'full'
+        formatted = tid and u_vim.eval('g:tracTicketFormat') == '1'
+        render = u_vim.eval('g:tracWikiRender')
+        ticket = self.ticket
+
+        def fetch(report=None):
+            if full and tid:
+                ticket.plan_query()
+            contents = {
+                'ticket': ticket.get(tid),
+                'edit': '',
+                'attachment': '\n'.join(ticket.attachments),
+            }
+            if full:
+                contents['list'] = ticket.get_all(report)
+            html = None
+            if formatted:
                 try:
-                    self.uiticket.windows['ticket'].load(contents['ticket'])
+                    html = self.wiki_to_html(contents['ticket'], render)
                 except Exception as e:
-                    print('Could not format the content')
                     print_error(e)
-        self.set_history('ticket', tid)
+            return contents, html
+
+        def render(result):
+            contents, html = result
+            titles = {'ticket': '#{0}'.format(tid) if tid else ''}
+            if full:
+                titles['list'] = 'Page {0} of {1}'.format(
+                        self.ticket.page, self.ticket.total_pages)
+            self.uiticket.create()
+            self.uiticket.update(contents, titles)
+            if tid:
+                self.uiticket.focus('ticket')
+                if html is not None:
+                    try:
+                        self.uiticket.windows['ticket'].load(html)
+                    except Exception as e:
+                        print('Could not format the content')
+                        print_error(e)
+            self.set_history('ticket', tid)
+            self.view = 'ticket'
+            self.prefetch_tickets(tid)
+
+        def arrived(result):
+            tickets, total = result
+            tlist = self.ticket.format_tickets(tickets)
+            tlist.extend(['', u' - Loading {0} of {1} tickets'.format(
+                len(tickets), total)])
+            self.uiticket.windows['list'].content = u'\n'.join(tlist)
+
+        if self.executor.enabled:
+            self.uiticket.create()
+            self.uiticket.loading(['ticket', 'list'] if full else ['ticket'])
+        self.executor.submit('ticket', self.batched(fetch, session),
+                             self.measure('ticket', render),
+                             arrived if full and self.executor.enabled
+                             else None)
+
+    def batched(self, job, session=None):
+        batch = self.batch
+        session = session or batch.session()
+
+        def wrapper(*args):
+            with batch.active(session):
+                return job(*args)
+        return self.bind(wrapper)
+
+    def measure(self, view, render):
+        def wrapper(result):
+            start, crossings = time.time(), u_vim.crossings
+            render(result)
+            self.crossings[view] = u_vim.crossings - crossings
+            metrics.record('view', view, time.time() - start)
+        return wrapper
+
+    def stats_view(self):
+        lines = metrics.report()
+        if self.crossings:
+            lines.extend([u'= Vim calls of the last render =', u''])
+            lines.extend([u' - {0}: {1}'.format(*c) for c in
+                          sorted(self.crossings.items())])
+        self.stats_window.content = u'\n'.join(lines or [u'No requests yet'])
+
+    def export_stats(self, file_name):
+        stats = metrics.export()
+        stats['crossings'] = self.crossings
+        with open(os.path.expanduser(file_name), 'w') as fp:
+            json.dump(stats, fp, indent=2, sort_keys=True)
+        print(u'Statistics written to {0}'.format(file_name))
+
+    def prefetch_tickets(self, tid):
+        ids = [t[0] for t in self.ticket.tickets]
+        pos = ids.index(tid) if tid in ids else -1
+        near = sorted([(abs(i - pos), t) for i, t in enumerate(ids)
+                       if t != tid])
+        jobs = [self.bind(functools.partial(self.ticket.prefetch, t))
+                for d, t in near[:4]]
+
+        for page in (self.ticket.page + 1, self.ticket.page - 1):
+            if 1 <= page <= self.ticket.total_pages:
+                query = self.ticket.query_string(page=page)
+                jobs.append(self.bind(functools.partial(
+                    self.ticket.prefetch_page, query)))
+
+        history = self.history['ticket']
+        if tid in history:
+            pos = history.index(tid)
+            for t in history[max(pos - 1, 0):pos + 2]:
+                if t != tid:
+                    jobs.append(self.bind(functools.partial(
+                        self.ticket.prefetch, t)))
+        self.prefetcher.schedule(jobs)
 
     def timeline_view(self, on=None, author=None):
-        self.timeline_window.content = timeline(self.server_url, on, author)
-        self.timeline_window.set_name(self.server_name)
+        max_entries = u_vim.eval('g:tracTimelineMax')
+        query = (self.server_name, on, author, max_entries)
+        window = self.timeline_window
+
+        def render(result):
+            if window.show(query, *result):
+                window.set_name(self.server_name)
+
+        if self.executor.enabled and window.query != query:
+            window.create()
+            window.loading()
+        server_url, cache = self.server_url, self.timeline_cache
+        self.executor.submit('timeline', lambda: timeline(server_url, cache,
+                             on, author, max_entries),
+                             self.measure('timeline', render))
 
     def server_view(self):
-        server_list = u_vim.eval('tracServerList')
-        default = u'{0}: '.format(u_vim.eval('tracDefaultServer'))
+        server_list = u_vim.eval('g:tracServerList')
+        default = u'{0}: '.format(u_vim.eval('g:tracDefaultServer'))
         current = u'{0}: '.format(self.server_name)
         servers = u'\n'.join([u'{0}: {1}'.format(key, val['server'])
                               for key, val in server_list.iteritems()])
@@ -1159,14 +3576,44 @@ class Trac(object):
     def search_view(self, keyword):
         search_window = SearchWindow(name=keyword.replace(' ', '_'),
                 prefix=u'Search ({0})'.format(self.server_name))
-        search_window.content = search(keyword)
+
+        def render(text):
+            search_window.content = text
+
+        self.ticket.load_settings()
+        mirror = self.ticket.mirror
+        if self.executor.enabled:
+            search_window.create()
+            search_window.loading()
+        self.executor.submit('search',
+                             self.batched(lambda: search(keyword, mirror)),
+                             self.measure('search', render))
 
     def changeset_view(self, changeset):
-        cs_url = '{scheme}://{server}/changeset/{changeset}'.format(
-                changeset=changeset, **self.server_url)
+        path = urllib.splithost('//' + self.server_url['server'])[1]
+        handler = u'{0}/changeset/{1}?format=diff'.format(path or '',
+                                                          changeset)
         changeset_window = ChangesetWindow(name=changeset,
                 prefix=u'Changeset ({0})'.format(self.server_name))
-        changeset_window.load(cs_url)
+        cache = self.changeset_cache
+
+        def fetch(report):
+            diff = cache.get(changeset)
+            if diff is None:
+                chunks = []
+                for chunk in self.server.fetch(handler.encode('utf-8')):
+                    chunks.append(chunk)
+                    report(chunk)
+                diff = ''.join(chunks)
+                cache.set(changeset, diff)
+            return diff
+
+        if self.executor.enabled:
+            changeset_window.create()
+            changeset_window.loading()
+        self.executor.submit('changeset', self.bind(fetch),
+                             self.measure('changeset', changeset_window.load),
+                             changeset_window.append)
 
     def sort_ticket(self, sorter, attr):
         self.ticket.set_sort_attr(sorter, attr)
@@ -1188,12 +3635,12 @@ class Trac(object):
         self.ticket_view()
 
     def ticket_paginate(self, direction=1):
-        try:
-            self.ticket.page += direction
-            self.ticket_view()
-        except:
-            self.ticket.page -= direction
+        page = self.ticket.page + direction
+        if page < 1 or page > self.ticket.total_pages:
             u_vim.command('echoerr "cannot go beyond current page"')
+            return
+        self.ticket.page = page
+        self.ticket_view()
 
     def create_ticket(self, type_=False, summary='new ticket'):
         description = self.ticket_content
@@ -1210,7 +3657,16 @@ class Trac(object):
         if tid is not None:
             self.ticket_view(tid)
 
+    def loaded(self, window):
+        if window.waiting:
+            u_vim.command('echoerr "Still loading. Not committing the '
+                          'changes."')
+            return False
+        return True
+
     def update_ticket(self, option, value=None):
+        if not self.loaded(self.uiticket.windows['ticket']):
+            return False
         text = self.ticket_content
         if option in ('summary', 'description'):
             value = text
@@ -1225,16 +3681,28 @@ class Trac(object):
         if not confirm('Update ticket #{0}?'.format(tid)):
             print('Update cancelled.')
             return False
-        if self.ticket.update(comment, attribs, False):
-            self.ticket_view()
+        session = self.batch.session()
+        with self.batch.active(session):
+            self.ticket.plan_view(tid)
+            updated = self.ticket.update(comment, attribs, False)
+        if updated:
+            self.ticket_view(session=session)
 
     def act_ticket(self, action):
+        if not self.loaded(self.uiticket.windows['ticket']):
+            return False
         if self.ticket.act(action, self.ticket_content):
             self.ticket_view()
 
     def save_wiki(self, comment):
-        if self.wiki.save(comment):
-            self.wiki_view()
+        if not self.loaded(self.uiwiki.windows['wiki']):
+            return False
+        session = self.batch.session()
+        with self.batch.active(session):
+            saved = self.wiki.save(comment,
+                                   u_vim.eval('g:tracWikiPreview') == '1')
+        if saved:
+            self.wiki_view(session=session)
 
     def open_line(self):
         line = vim.current.line
@@ -1297,7 +3765,8 @@ class Trac(object):
             return
 
         try:
-            file_name = save_html(self.server.wiki.wikiToHtml(wikitext))
+            html = self.wiki_to_html(wikitext, u_vim.eval('g:tracWikiRender'))
+            file_name = save_html(html)
             webbrowser.open(u'file://{0}'.format(file_name))
         except Exception as e:
             print_error(e)
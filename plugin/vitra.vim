@@ -7,18 +7,8 @@ if !has("python")
     finish
 endif
 
-python << EOF
-import sys
-if sys.version_info[:2] < (2, 6):
-    print("vitra requires python 2.6 or later to work correctly")
-    vim.command('let s:pythonVersion = 1')
-EOF
-
-if exists('s:pythonVersion')
-    finish
-endif
-
 let g:vitra_loaded = 1
+let s:vitraScript = expand('<sfile>:p:h') . '/vitra.py'
 
 fun s:vitraDefault(name, default)
     if !exists(a:name)
@@ -28,60 +18,81 @@ endfun
 
 call s:vitraDefault('g:tracDefaultServer', '')
 call s:vitraDefault('g:tracDefaultComment', 'Updated from Vitra')
+call s:vitraDefault('g:tracServerStates', 4)
 call s:vitraDefault('g:tracTempHtml', '/tmp/trac_wiki.html')
+call s:vitraDefault('g:tracCacheDir', expand('~/.cache/vitra'))
 
 call s:vitraDefault('g:tracTicketClause', 'status!=closed')
 call s:vitraDefault('g:tracTicketGroup', 'milestone')
 call s:vitraDefault('g:tracTicketOrder', 'priority')
+call s:vitraDefault('g:tracTicketIncremental', 1)
+call s:vitraDefault('g:tracTicketColumnWidths', {})
+call s:vitraDefault('g:tracMirror', 0)
+call s:vitraDefault('g:tracTicketFieldsTTL', 3600)
+call s:vitraDefault('g:tracTicketChunkSize', 200)
+call s:vitraDefault('g:tracTicketChunkWorkers', 4)
 
 call s:vitraDefault('g:tracWikiStyle', 'full')
 call s:vitraDefault('g:tracWikiPreview', 1)
 call s:vitraDefault('g:tracWikiToC', 1)
 call s:vitraDefault('g:tracHideTracWiki', 1)
+call s:vitraDefault('g:tracWikiIndexTTL', 300)
 
 call s:vitraDefault('g:tracTicketStyle', 'full')
 call s:vitraDefault('g:tracTicketFormat', 1)
+call s:vitraDefault('g:tracWikiRender', 'auto')
 
 call s:vitraDefault('g:tracTimelineMax', 50)
 
-com! -nargs=? -complete=customlist,ComTracServers TracServer  python trac.server=<q-args>
+call s:vitraDefault('g:tracCompletionLimit', 50)
+
+call s:vitraDefault('g:tracAsync', 1)
+call s:vitraDefault('g:tracLazyLoad', 1)
+call s:vitraDefault('g:tracPrefetchWorkers', 2)
+call s:vitraDefault('g:tracPrefetchBudget', 524288)
 
-com! -nargs=? -complete=customlist,ComWiki TWOpen python trac.wiki_view(<q-args>)
-com! -nargs=0 TWClose python trac.uiwiki.destroy()
-com! -nargs=* TWSave python trac.save_wiki(<q-args>)
-com! -nargs=0 TWInfo python print trac.wiki.current
+com! -nargs=? -complete=customlist,ComTracServers TracServer  call VitraRun('trac.server=vim.eval("a:1")', <q-args>)
 
-com! -nargs=? -complete=customlist,ComTicket TTOpen python trac.ticket_view(<q-args>)
-com! -nargs=0 TTClose python trac.uiticket.destroy()
+com! -nargs=? -complete=customlist,ComWiki TWOpen call VitraRun('trac.wiki_view(vim.eval("a:1"))', <q-args>)
+com! -nargs=0 TWClose call VitraRun('trac.uiwiki.destroy()')
+com! -nargs=* TWSave call VitraRun('trac.save_wiki(vim.eval("a:1"))', <q-args>)
+com! -nargs=0 TWInfo call VitraRun('print trac.wiki.current')
 
-com! -nargs=0 TTEditSummary python trac.load_current('summary')
-com! -nargs=0 TTEditDescription python trac.load_current('description')
-com! -nargs=0 TTSetSummary python trac.update_ticket('summary')
-com! -nargs=0 TTSetDescription python trac.update_ticket('description')
-com! -nargs=0 TTAddComment python trac.update_ticket('comment')
+com! -nargs=? -complete=customlist,ComTicket TTOpen call VitraRun('trac.ticket_view(vim.eval("a:1"))', <q-args>)
+com! -nargs=0 TTClose call VitraRun('trac.uiticket.destroy()')
 
-com! -nargs=0 TTClearAllFilters python trac.filter_clear()
-com! -nargs=? -complete=customlist,ComSort TTClearFilter python trac.filter_clear(<q-args>)
+com! -nargs=0 TTEditSummary call VitraRun('trac.load_current("summary")')
+com! -nargs=0 TTEditDescription call VitraRun('trac.load_current("description")')
+com! -nargs=0 TTSetSummary call VitraRun('trac.update_ticket("summary")')
+com! -nargs=0 TTSetDescription call VitraRun('trac.update_ticket("description")')
+com! -nargs=0 TTAddComment call VitraRun('trac.update_ticket("comment")')
 
-com! -nargs=? -complete=customlist,ComSort TTOrderBy python trac.sort_ticket('order', <q-args>)
-com! -nargs=? -complete=customlist,ComSort TTGroupBy python trac.sort_ticket('group', <q-args>)
+com! -nargs=0 TTClearAllFilters call VitraRun('trac.filter_clear()')
+com! -nargs=? -complete=customlist,ComSort TTClearFilter call VitraRun('trac.filter_clear(vim.eval("a:1"))', <q-args>)
 
-com! -nargs=0 TTNextPage python trac.ticket_paginate()
-com! -nargs=0 TTPreviousPage python trac.ticket_paginate(-1)
-com! -nargs=0 TTFirstPage python trac.ticket.page = 1; trac.ticket_view()
-com! -nargs=0 TTLastPage python trac.ticket.page = trac.ticket.total_pages; trac.ticket_view()
+com! -nargs=? -complete=customlist,ComSort TTOrderBy call VitraRun('trac.sort_ticket("order", vim.eval("a:1"))', <q-args>)
+com! -nargs=? -complete=customlist,ComSort TTGroupBy call VitraRun('trac.sort_ticket("group", vim.eval("a:1"))', <q-args>)
 
-com! -nargs=+ -complete=customlist,ComAction TTAction python trac.act_ticket(<q-args>)
+com! -nargs=0 TTNextPage call VitraRun('trac.ticket_paginate()')
+com! -nargs=0 TTPreviousPage call VitraRun('trac.ticket_paginate(-1)')
+com! -nargs=0 TTFirstPage call VitraRun('trac.ticket.page = 1; trac.ticket_view()')
+com! -nargs=0 TTLastPage call VitraRun('trac.ticket.page = trac.ticket.total_pages; trac.ticket_view()')
 
-com! -nargs=* -complete=customlist,ComTracType TTimeline python trac.timeline_view(<f-args>)
-com! -nargs=+ TSearch python trac.search_view(<q-args>)
-com! -nargs=1 TChangeset python trac.changeset_view(<q-args>)
-com! -nargs=0 TServer python trac.server_view()
+com! -nargs=+ -complete=customlist,ComAction TTAction call VitraRun('trac.act_ticket(vim.eval("a:1"))', <q-args>)
 
-com! -nargs=? -complete=file TAddAttachment python trac.add_attachment(<q-args>)
-com! -nargs=0 TPreview python trac.preview()
-com! -nargs=0 TBack python trac.back()
-com! -nargs=0 TForward python trac.back(True)
+com! -nargs=* -complete=customlist,ComTracType TTimeline call VitraRun('trac.timeline_view(*vim.eval("a:000"))', <f-args>)
+com! -nargs=+ TSearch call VitraRun('trac.search_view(vim.eval("a:1"))', <q-args>)
+com! -nargs=1 TChangeset call VitraRun('trac.changeset_view(vim.eval("a:1"))', <q-args>)
+com! -nargs=0 TServer call VitraRun('trac.server_view()')
+com! -nargs=0 TCrossings call VitraRun('print trac.crossings')
+com! -nargs=0 TStats call VitraRun('trac.stats_view()')
+com! -nargs=1 -complete=file TStatsExport call VitraRun('trac.export_stats(vim.eval("a:1"))', <q-args>)
+com! -nargs=0 TStatsReset call VitraRun('metrics.reset()')
+
+com! -nargs=? -complete=file TAddAttachment call VitraRun('trac.add_attachment(vim.eval("a:1"))', <q-args>)
+com! -nargs=0 TPreview call VitraRun('trac.preview()')
+com! -nargs=0 TBack call VitraRun('trac.back()')
+com! -nargs=0 TForward call VitraRun('trac.back(True)')
 
 fun ComTracServers(A, L, P)
     return filter(keys(g:tracServerList), 'v:val =~ "^' . a:A . '"')
@@ -92,24 +103,76 @@ fun ComTracType(A, L, P)
 endfun
 
 fun ComWiki(A, L, P)
-    python trac.wiki.get_options()
-    return filter(g:tracOptions, 'v:val =~ "^' . a:A . '"')
+    if !VitraLoad()
+        return []
+    endif
+    python trac.wiki.complete(vim.eval('a:A'))
+    return g:tracOptions
 endfun
 
 fun ComTicket(A, L, P)
-    python trac.ticket.get_options(type_='history')
-    return filter(g:tracOptions, 'v:val =~ "^' . a:A . '"')
+    if !VitraLoad()
+        return []
+    endif
+    python trac.ticket.complete(vim.eval('a:A'), type_='history')
+    return g:tracOptions
 endfun
 
 fun ComSort(A, L, P)
-    python trac.ticket.get_options(type_='field')
-    return filter(g:tracOptions, 'v:val =~ "^' . a:A . '"')
+    if !VitraLoad()
+        return []
+    endif
+    python trac.ticket.complete(vim.eval('a:A'), type_='field')
+    return g:tracOptions
 endfun
 
 fun ComAction(A, L, P)
-    python trac.ticket.get_options(type_='action')
-    return filter(g:tracOptions, 'v:val =~ "^' . a:A . '"')
+    if !VitraLoad()
+        return []
+    endif
+    python trac.ticket.complete(vim.eval('a:A'), type_='action')
+    return g:tracOptions
+endfun
+
+fun VitraRun(code, ...)
+    if VitraLoad()
+        exe 'python ' . a:code
+    endif
+endfun
+
+fun VitraPoll(timer)
+    python trac.executor.poll()
+endfun
+
+fun VitraBatch(cmds)
+    let lazyredraw = &lazyredraw
+    set lazyredraw
+    try
+        for cmd in a:cmds
+            exe cmd
+        endfor
+    finally
+        let &lazyredraw = lazyredraw
+    endtry
+endfun
+
+fun VitraLoad()
+    if exists('s:vitraState')
+        return s:vitraState
+    endif
+python << EOF
+import sys
+if sys.version_info[:2] < (2, 6):
+    print("vitra requires python 2.6 or later to work correctly")
+    vim.command('let s:vitraState = 0')
+EOF
+    if !exists('s:vitraState')
+        exe 'pyfile ' . fnameescape(s:vitraScript)
+        python trac_init(); vim.command('let s:vitraState = 1')
+    endif
+    return exists('s:vitraState') && s:vitraState
 endfun
 
-pyfile <sfile>:p:h/vitra.py
-python trac_init()
+if !g:tracLazyLoad
+    call VitraLoad()
+endif
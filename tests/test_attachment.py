@@ -0,0 +1,147 @@
+# -*- encoding: utf-8 -*-
+
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+import xmlrpclib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'plugin'))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+import server
+import vitra
+
+srv = None
+
+
+def setUpModule():
+    global srv
+    srv = server.TracServer(server.Dataset(20, 5))
+    port = srv.start()
+    vitra.vim.load_defaults(os.path.join(ROOT, 'plugin', 'vitra.vim'))
+    vitra.vim.vars.update({
+        'tracServerList': {
+            'test': {'server': '127.0.0.1:{0}'.format(port)},
+        },
+        'tracDefaultServer': 'test',
+        'tracCacheDir': '',
+        'tracPrefetchWorkers': 0,
+        'tracMirror': 0,
+    })
+    vitra.trac_init()
+
+
+def tearDownModule():
+    vitra.trac.disconnect()
+    srv.shutdown()
+    srv.server_close()
+
+
+class Response(object):
+    def __init__(self, body):
+        self.body = body
+
+    def getheader(self, name, default=None):
+        if name == 'content-length':
+            return str(len(self.body))
+        return default
+
+    def read(self, size=-1):
+        size = len(self.body) if size < 0 else size
+        data, self.body = self.body[:size], self.body[size:]
+        return data
+
+
+class AttachmentTest(unittest.TestCase):
+    SIZES = (0, 1, 2, 3, 4, 100, vitra.AttachmentBody.CHUNK_SIZE,
+             vitra.AttachmentBody.CHUNK_SIZE * 2 + 1)
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.path = tempfile.mkdtemp()
+        os.chdir(self.path)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.path)
+
+    def write(self, name, size):
+        data = os.urandom(size)
+        with open(name, 'wb') as fp:
+            fp.write(data)
+        return data
+
+    def test_body(self):
+        for size in self.SIZES:
+            data = self.write('upload.bin', size)
+            body = vitra.AttachmentBody('ticket.putAttachment',
+                                        (1, 'upload.bin', u'desc'),
+                                        'upload.bin')
+            request = body.read()
+            self.assertEqual(len(body), len(request), size)
+            params, method = xmlrpclib.loads(request)
+            self.assertEqual(method, 'ticket.putAttachment')
+            self.assertEqual(params[:3], (1, 'upload.bin', u'desc'))
+            self.assertEqual(params[3].data, data)
+            body.seek(0)
+            chunks = iter(lambda: body.read(1000), '')
+            self.assertEqual(''.join(chunks), request)
+
+    def test_read_binary(self):
+        proxy = vitra.trac.server
+        self.addCleanup(vars(proxy).pop, 'CHUNK_SIZE', None)
+        for size in self.SIZES:
+            data = os.urandom(size)
+            body = xmlrpclib.dumps((xmlrpclib.Binary(data), ),
+                                   methodresponse=True)
+            for chunk_size in (7, 64, 65536):
+                proxy.CHUNK_SIZE = chunk_size
+                with tempfile.TemporaryFile() as fp:
+                    done = proxy.read_binary(Response(body), fp)
+                    fp.seek(0)
+                    self.assertEqual(fp.read(), data, (size, chunk_size))
+                self.assertEqual(done, len(body))
+
+    def test_read_binary_errors(self):
+        proxy = vitra.trac.server
+        fault = xmlrpclib.dumps(xmlrpclib.Fault(1, 'missing'),
+                                methodresponse=True)
+        body = xmlrpclib.dumps((xmlrpclib.Binary('x' * 1000), ),
+                               methodresponse=True)
+        with tempfile.TemporaryFile() as fp:
+            self.assertRaises(xmlrpclib.Fault, proxy.read_binary,
+                              Response(fault), fp)
+            self.assertRaises(xmlrpclib.ResponseError, proxy.read_binary,
+                              Response(body[:-100]), fp)
+
+    def test_round_trip(self):
+        for size in self.SIZES:
+            data = self.write('round.bin', size)
+            vitra.trac.ticket.current = {'id': 1}
+            self.assertTrue(vitra.trac.ticket.add_attachment('round.bin'))
+            os.remove('round.bin')
+            self.assertTrue(vitra.trac.ticket.get_attachment('round.bin'))
+            with open('round.bin', 'rb') as fp:
+                self.assertEqual(fp.read(), data, size)
+            os.remove('round.bin')
+
+    def test_failed_download_removed(self):
+        self.assertRaises(xmlrpclib.Fault, vitra.save_attachment,
+                          'ticket.getAttachment', (1, 'missing.bin'),
+                          'missing.bin')
+        self.assertEqual(os.listdir('.'), [])
+
+    def test_existing_file_kept(self):
+        data = self.write('kept.bin', 10)
+        self.assertFalse(vitra.save_attachment(
+            'ticket.getAttachment', (1, 'kept.bin'), 'kept.bin'))
+        with open('kept.bin', 'rb') as fp:
+            self.assertEqual(fp.read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
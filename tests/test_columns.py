@@ -0,0 +1,61 @@
+# -*- encoding: utf-8 -*-
+
+import os.path
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'plugin'))
+
+import vitra
+
+
+class AlignColumnsTest(unittest.TestCase):
+    def test_align(self):
+        rows = [[u'#', u'Summary', u'Owner'],
+                [u'1', u'Short', u'user1'],
+                [u'100', u'A longer summary', u'u']]
+        self.assertEqual(vitra.align_columns(rows), [
+            u'  # || Summary          || Owner',
+            u'  1 || Short            || user1',
+            u'100 || A longer summary || u',
+        ])
+
+    def test_truncate(self):
+        rows = [[u'#', u'Summary', u'Owner'],
+                [u'1', u'A much longer summary', u'someone']]
+        self.assertEqual(vitra.align_columns(rows, [None, 10, 2]), [
+            u'# || Summary    || Ow',
+            u'1 || A much ... || so',
+        ])
+
+    def test_wide_characters(self):
+        rows = [[u'#', u'Summary', u'Owner'],
+                [u'1', u'日本語のチケット',
+                 u'山田'],
+                [u'2', u'Cafe\u0301 ticket', u'me']]
+        lines = vitra.align_columns([r[:] for r in rows], [None, 9, None])
+        self.assertEqual(lines, [
+            u'# || Summary   || Owner',
+            u'1 || 日本語... || 山田',
+            u'2 || Cafe\u0301 t... || me',
+        ])
+        self.assertEqual(len(set([vitra.display_width(l.split(u'||')[1])
+                                  for l in lines])), 1)
+        self.assertEqual(vitra.align_columns(rows, [None, 8, None])[1],
+                         u'1 || 日本...  || 山田')
+
+    def test_empty_columns(self):
+        rows = [[u'#', u'', u'Owner'],
+                [u'1', u'', u''],
+                [u'2', u'', u'user2']]
+        self.assertEqual(vitra.align_columns(rows, [None, 5, 5]), [
+            u'# ||  || Owner',
+            u'1 ||  ||',
+            u'2 ||  || user2',
+        ])
+        self.assertEqual(vitra.align_columns([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# -*- encoding: utf-8 -*-
+
+import os.path
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'plugin'))
+
+import vitra
+
+WORDS = [u'WikiStart', u'TracGuide', u'TracWiki', u'SandBox', u'wikipedia',
+         u'TracWikiMacros', u'WeirdKit', u'Kiwi', u'WikiFormatting']
+
+
+class CompletionIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = vitra.CompletionIndex(WORDS)
+
+    def test_ranking(self):
+        self.assertEqual(self.index.match(u'wiki'), [
+            # prefix, case-insensitive and sorted
+            u'WikiFormatting', u'wikipedia', u'WikiStart',
+            # substring, by position
+            u'TracWiki', u'TracWikiMacros',
+            # fuzzy, by span
+            u'WeirdKit',
+        ])
+
+    def test_substring_before_fuzzy(self):
+        self.assertEqual(self.index.match(u'box'), [u'SandBox'])
+        self.assertEqual(self.index.match(u'sbx'), [u'SandBox'])
+        self.assertEqual(self.index.match(u'gui')[0], u'TracGuide')
+
+    def test_limit(self):
+        self.assertEqual(self.index.match(u'wiki', 2),
+                         [u'WikiFormatting', u'wikipedia'])
+        self.assertEqual(self.index.match(u'wiki', 4),
+                         [u'WikiFormatting', u'wikipedia', u'WikiStart',
+                          u'TracWiki'])
+        self.assertEqual(len(self.index.match(u'', 3)), 3)
+        self.assertEqual(len(self.index.match(u'')), len(WORDS))
+
+    def test_no_match(self):
+        self.assertEqual(self.index.match(u'zzz'), [])
+
+    def test_update(self):
+        self.index.update(WORDS[1:] + [u'WikiNew'])
+        self.assertEqual(self.index.match(u'wikistart'), [])
+        self.assertEqual(self.index.match(u'wikine'), [u'WikiNew'])
+        words = [u'Page{0}'.format(i) for i in range(100)]
+        self.index.update(words)
+        self.assertEqual(self.index.match(u'page1', 3),
+                         [u'Page1', u'Page10', u'Page11'])
+        self.assertEqual(self.index.match(u'wiki'), [])
+
+
+class CompleteTest(unittest.TestCase):
+    def setUp(self):
+        vitra.vim.load_defaults(os.path.join(ROOT, 'plugin', 'vitra.vim'))
+
+    def test_limit_option(self):
+        index = vitra.CompletionIndex(WORDS)
+        vitra.vim.vars['tracCompletionLimit'] = 3
+        vitra.complete(index, 'wiki')
+        self.assertEqual(vitra.vim.vars['tracOptions'],
+                         ['WikiFormatting', 'wikipedia', 'WikiStart'])
+        vitra.vim.vars['tracCompletionLimit'] = 50
+        vitra.complete(index, 'trac')
+        self.assertEqual(vitra.vim.vars['tracOptions'],
+                         ['TracGuide', 'TracWiki', 'TracWikiMacros'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+# -*- encoding: utf-8 -*-
+
+import os.path
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'plugin'))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+import server
+import vitra
+
+dataset = None
+srv = None
+
+
+def setUpModule():
+    global dataset, srv
+    dataset = server.Dataset(500, 20)
+    srv = server.TracServer(dataset)
+    port = srv.start()
+    vitra.vim.load_defaults(os.path.join(ROOT, 'plugin', 'vitra.vim'))
+    vitra.vim.vars.update({
+        'tracServerList': {
+            'test': {'server': '127.0.0.1:{0}'.format(port)},
+        },
+        'tracDefaultServer': 'test',
+        'tracCacheDir': '',
+        'tracPrefetchWorkers': 0,
+        'tracMirror': 0,
+    })
+    vitra.trac_init()
+
+
+def tearDownModule():
+    vitra.trac.disconnect()
+    srv.shutdown()
+    srv.server_close()
+
+
+class MirrorTest(unittest.TestCase):
+    QUERIES = [
+        'status=new&order=id',
+        'status!=closed&order=id&max=0',
+        'priority=blocker|critical&order=id&max=0',
+        'component!=component1|component2&order=id&max=0',
+        'owner~=user1&order=id&max=0',
+        'owner~=user1|user2&status=new&order=id&max=0',
+        'status!=closed&order=priority&max=0',
+        'status=new&group=type&order=priority&max=0',
+        'status=new&group=priority&order=id&max=0',
+        'group=type&order=id&max=50&page=2',
+        'type=task&order=priority&max=25&page=2',
+        'order=id&desc=1&max=20&page=3',
+    ]
+
+    def setUp(self):
+        self.mirror = vitra.Mirror('test')
+        self.assertEqual(self.mirror.sync(), [])
+
+    def query(self, query):
+        total, tickets = self.mirror.query(query, dataset.options)
+        return [t[0] for t in tickets]
+
+    def test_queries(self):
+        for query in self.QUERIES:
+            self.assertEqual(self.query(query), dataset.query(query), query)
+
+    def test_total(self):
+        total, tickets = self.mirror.query('status=new&order=id&max=10',
+                                           dataset.options)
+        self.assertEqual(len(tickets), 10)
+        self.assertEqual(total, len(dataset.query('status=new&max=0')))
+
+    def test_unsupported(self):
+        for query in ('id=1', 'status=new&id=2..5', 'owner=$USER',
+                      'status'):
+            self.assertEqual(self.mirror.query(query, dataset.options),
+                             None, query)
+
+    def test_sync_after_update(self):
+        query = 'priority=trivial&milestone=milestone3&order=id&max=0'
+        tid = [t for t in dataset.query('priority=blocker&max=0')
+               if t not in dataset.query(query)][0]
+        vitra.trac.server.ticket.update(tid, u'', {
+            'priority': 'trivial', 'milestone': 'milestone3'})
+        self.assertNotIn(tid, self.query(query))
+        self.assertIn(tid, self.mirror.sync())
+        self.assertIn(tid, self.query(query))
+        self.assertEqual(self.query(query), dataset.query(query))
+        self.assertNotIn(tid, self.query('priority=blocker&max=0'))
+        self.assertEqual(self.mirror.sync(), [])
+
+    def test_unwritable_cache_dir(self):
+        with tempfile.NamedTemporaryFile() as fp:
+            vitra.vim.vars['tracCacheDir'] = fp.name
+            try:
+                mirror = vitra.Mirror('test')
+            finally:
+                vitra.vim.vars['tracCacheDir'] = ''
+        self.assertEqual(mirror.sync(), [])
+        self.assertEqual(mirror.query('status=new&order=id', {}),
+                         self.mirror.query('status=new&order=id', {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+# -*- encoding: utf-8 -*-
+
+import glob
+import io
+import os.path
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'plugin'))
+
+import vitra
+
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures', 'render')
+BASE_URL = 'http://trac.example.com/'
+
+
+def read(name):
+    with io.open(os.path.join(FIXTURES, name), encoding='utf-8') as fp:
+        return fp.read()
+
+
+class RenderTest(unittest.TestCase):
+    def fixtures(self, ext):
+        names = [os.path.basename(p)[:-len(ext)]
+                 for p in glob.glob(os.path.join(FIXTURES, '*' + ext))]
+        self.assertTrue(names)
+        return sorted(names)
+
+    def test_wiki_to_html(self):
+        for name in self.fixtures('.wiki'):
+            html = vitra.wiki_to_html(read(name + '.wiki'), BASE_URL)
+            self.assertEqual(html + u'\n', read(name + '.html'), name)
+
+    def test_html_to_text(self):
+        for name in self.fixtures('.html'):
+            text = vitra.html_to_text(read(name + '.html'), BASE_URL)
+            self.assertEqual(text + u'\n', read(name + '.txt'), name)
+
+    def test_needs_server(self):
+        for text in (u'[[TicketQuery(status=new)]]', u'[[PageOutline]]',
+                     u'{{{#!python\nx = 1\n}}}', u'[[Image(a.png)]]'):
+            self.assertTrue(vitra.WikiFormatter.needs_server(text), text)
+        for text in (u'= Title =', u'[[BR]]', u'[[WikiStart]]',
+                     u'{{{\ncode\n}}}'):
+            self.assertFalse(vitra.WikiFormatter.needs_server(text), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
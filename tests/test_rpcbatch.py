@@ -0,0 +1,149 @@
+# -*- encoding: utf-8 -*-
+
+import os.path
+import sys
+import unittest
+import xmlrpclib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'plugin'))
+
+import vitra
+
+
+class Server(object):
+    def __init__(self, faults=(), down=False):
+        self.faults = faults
+        self.down = down
+        self.sent = []
+
+    def value(self, method, params):
+        if method in self.faults:
+            return {'faultCode': 1, 'faultString': method}
+        return [u'{0}{1}'.format(method, list(params))]
+
+    def __call__(self, method, params):
+        if self.down:
+            raise xmlrpclib.Fault(2, 'down')
+        if method == 'system.multicall':
+            calls = [(c['methodName'], c['params']) for c in params[0]]
+            self.sent.append([m for m, p in calls])
+            return [self.value(m, p) for m, p in calls]
+        self.sent.append([method])
+        value = self.value(method, params)
+        if isinstance(value, dict):
+            raise xmlrpclib.Fault(value['faultCode'], value['faultString'])
+        return value[0]
+
+
+def multicall(*calls):
+    return ([{'methodName': m, 'params': list(p)} for m, p in calls], )
+
+
+class RPCBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.batch = vitra.RPCBatch()
+
+    def test_single_call(self):
+        send = Server()
+        self.assertEqual(self.batch.call(send, 'ticket.get', (1, )),
+                         u'ticket.get[1]')
+        self.assertEqual(send.sent, [['ticket.get']])
+
+    def test_single_fault(self):
+        send = Server(faults=('ticket.get', ))
+        self.assertRaises(xmlrpclib.Fault, self.batch.call, send,
+                          'ticket.get', (1, ))
+
+    def test_fault_in_multicall(self):
+        send = Server(faults=('ticket.changeLog', ))
+        result = self.batch.call(send, 'system.multicall', multicall(
+            ('ticket.get', (1, )), ('ticket.changeLog', (1, ))))
+        self.assertEqual(result[0], [u'ticket.get[1]'])
+        self.assertEqual(result[1]['faultString'], 'ticket.changeLog')
+
+    def test_fault_fans_out(self):
+        send = Server(down=True)
+        result = self.batch.call(send, 'system.multicall', multicall(
+            ('ticket.get', (1, )), ('ticket.get', (1, )),
+            ('ticket.changeLog', (1, ))))
+        self.assertEqual(len(result), 3)
+        for value in result:
+            self.assertEqual(value, {'faultCode': 2, 'faultString': 'down'})
+
+    def test_duplicates_sent_once(self):
+        send = Server()
+        with self.batch.active(self.batch.session()):
+            result = self.batch.call(send, 'system.multicall', multicall(
+                ('ticket.get', (1, )), ('ticket.get', (1, )),
+                ('ticket.get', (2, ))))
+        self.assertEqual(send.sent, [['ticket.get', 'ticket.get']])
+        self.assertEqual(result[0], result[1])
+        self.assertEqual(result[2], [u'ticket.get[2]'])
+
+    def test_no_session(self):
+        send = Server()
+        calls = [('ticket.get', (i % 100, )) for i in range(200)]
+        result = self.batch.call(send, 'system.multicall', multicall(*calls))
+        self.assertEqual(len(send.sent[0]), 200)
+        self.assertEqual(result[150], [u'ticket.get[50]'])
+
+    def test_memo(self):
+        send = Server()
+        with self.batch.active(self.batch.session()):
+            self.batch.call(send, 'ticket.get', (1, ))
+            self.batch.call(send, 'ticket.get', (1, ))
+        self.batch.call(send, 'ticket.get', (1, ))
+        self.assertEqual(send.sent, [['ticket.get'], ['ticket.get']])
+
+    def test_faults_not_memoized(self):
+        send = Server(faults=('ticket.get', ))
+        with self.batch.active(self.batch.session()):
+            for i in range(2):
+                self.assertRaises(xmlrpclib.Fault, self.batch.call, send,
+                                  'ticket.get', (1, ))
+        self.assertEqual(len(send.sent), 2)
+
+    def test_deferred_reads_lead(self):
+        send = Server()
+        with self.batch.active(self.batch.session()):
+            self.batch.defer('ticket.changeLog', (1, ))
+            self.batch.call(send, 'ticket.get', (1, ))
+            self.batch.call(send, 'ticket.changeLog', (1, ))
+        self.assertEqual(send.sent, [['ticket.changeLog', 'ticket.get']])
+
+    def test_defer_without_session(self):
+        send = Server()
+        self.batch.defer('ticket.changeLog', (1, ))
+        self.batch.call(send, 'ticket.get', (1, ))
+        self.assertEqual(send.sent, [['ticket.get']])
+
+    def test_write_invalidates_memo(self):
+        send = Server()
+        with self.batch.active(self.batch.session()):
+            self.batch.call(send, 'ticket.get', (1, ))
+            self.batch.defer('ticket.get', (1, ))
+            self.batch.call(send, 'ticket.update', (1, u'comment', {}))
+            self.batch.call(send, 'ticket.get', (1, ))
+        self.assertEqual(send.sent, [['ticket.get'],
+                                     ['ticket.update', 'ticket.get']])
+
+    def test_write_fault_keeps_reads(self):
+        send = Server(faults=('ticket.update', ))
+        with self.batch.active(self.batch.session()):
+            self.batch.defer('ticket.get', (1, ))
+            self.assertRaises(xmlrpclib.Fault, self.batch.call, send,
+                              'ticket.update', (1, u'comment', {}))
+            self.batch.call(send, 'ticket.get', (1, ))
+        self.assertEqual(send.sent, [['ticket.update', 'ticket.get']])
+
+    def test_sessions_are_separate(self):
+        send = Server()
+        for i in range(2):
+            with self.batch.active(self.batch.session()):
+                self.batch.call(send, 'ticket.get', (1, ))
+        self.assertEqual(len(send.sent), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
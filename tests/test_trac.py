@@ -0,0 +1,83 @@
+# -*- encoding: utf-8 -*-
+
+import os.path
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'plugin'))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+import server
+import vitra
+
+servers = []
+
+
+def setUpModule():
+    urls = {}
+    for name in ('test', 'other'):
+        servers.append(server.TracServer(server.Dataset(50, 5)))
+        urls[name] = {'server': '127.0.0.1:{0}'.format(servers[-1].start())}
+    vitra.vim.load_defaults(os.path.join(ROOT, 'plugin', 'vitra.vim'))
+    vitra.vim.vars.update({
+        'tracServerList': urls,
+        'tracDefaultServer': 'test',
+        'tracCacheDir': '',
+        'tracPrefetchWorkers': 0,
+        'tracMirror': 0,
+    })
+    vitra.trac_init()
+
+
+def tearDownModule():
+    vitra.trac.disconnect()
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
+
+
+class ServerSwitchTest(unittest.TestCase):
+    def test_views_restored(self):
+        trac = vitra.trac
+        trac.ticket_view(3)
+        ticket = trac.uiticket.windows['ticket'].content
+        trac.server = 'other'
+        self.assertEqual(trac.view, None)
+        trac.wiki_view('WikiStart')
+        wiki = trac.uiwiki.windows['wiki'].content
+        for i in range(3):
+            trac.server = 'test'
+            self.assertEqual(trac.view, 'ticket')
+            self.assertEqual(trac.uiticket.windows['ticket'].content, ticket)
+            trac.server = 'other'
+            self.assertEqual(trac.view, 'wiki')
+            self.assertEqual(trac.uiwiki.windows['wiki'].content, wiki)
+
+
+class ChangesetWindowTest(unittest.TestCase):
+    DIFF = u'--- a\n+caf\xe9\r\n+end\n'.encode('utf-8')
+
+    def setUp(self):
+        self.window = vitra.ChangesetWindow(name='1', prefix=u'Changeset')
+        self.window.create()
+
+    def tearDown(self):
+        self.window.destroy()
+
+    def test_load(self):
+        for i in range(2):
+            self.window.load(self.DIFF)
+            self.assertEqual(self.window.buffer[:],
+                             ['--- a', '+caf\xc3\xa9', '+end'])
+
+    def test_streamed(self):
+        self.window.append(self.DIFF[:9])
+        self.window.append(self.DIFF[9:])
+        self.window.load(self.DIFF)
+        self.assertEqual(self.window.buffer[:],
+                         ['--- a', '+caf\xc3\xa9', '+end'])
+
+
+if __name__ == '__main__':
+    unittest.main()
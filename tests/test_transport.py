@@ -0,0 +1,149 @@
+# -*- encoding: utf-8 -*-
+
+import base64
+import os.path
+import socket
+import sys
+import threading
+import unittest
+import xmlrpclib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'plugin'))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+import server
+import vitra
+
+
+class FlakyServer(object):
+    RESPONSE = xmlrpclib.dumps((u'ok', ), methodresponse=True)
+
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.requests = []
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+
+    def serve(self):
+        while True:
+            conn, address = self.sock.accept()
+            thread = threading.Thread(target=self.handle, args=(conn, ))
+            thread.daemon = True
+            thread.start()
+
+    def handle(self, conn):
+        fp = conn.makefile('rb')
+        for served in range(2):
+            headers = {}
+            line = fp.readline()
+            while line.strip():
+                line = fp.readline()
+                name, sep, value = line.partition(':')
+                headers[name.lower()] = value.strip()
+            body = fp.read(int(headers.get('content-length', 0)))
+            self.requests.append((headers, body))
+            if served:
+                break
+            conn.sendall('HTTP/1.1 200 OK\r\nContent-Type: text/xml\r\n'
+                         'Content-Length: {0}\r\n\r\n{1}'.format(
+                             len(self.RESPONSE), self.RESPONSE))
+        fp.close()
+        conn.close()
+
+
+class TransportTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FlakyServer()
+        self.host = '127.0.0.1:{0}'.format(self.server.port)
+
+    def proxy(self, transport):
+        return vitra.ServerProxy('http://{0}/rpc'.format(self.host),
+                                 transport)
+
+    def test_read_retried(self):
+        proxy = self.proxy(vitra.HTTPBasicTransport('http', ''))
+        self.assertEqual(proxy.ticket.get(1), u'ok')
+        self.assertEqual(proxy.ticket.get(1), u'ok')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_write_not_retried(self):
+        proxy = self.proxy(vitra.HTTPBasicTransport('http', ''))
+        self.assertEqual(proxy.ticket.get(1), u'ok')
+        self.assertRaises(Exception, proxy.ticket.update, 1, u'', {})
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_multicall_write_not_retried(self):
+        proxy = self.proxy(vitra.HTTPBasicTransport('http', ''))
+        self.assertEqual(proxy.ticket.get(1), u'ok')
+        mc = xmlrpclib.MultiCall(proxy)
+        mc.ticket.get(1)
+        mc.wiki.putPage('WikiStart', u'', {})
+        self.assertRaises(Exception, mc)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_basic_credentials_unquoted(self):
+        proxy = self.proxy(vitra.HTTPBasicTransport('http', 'us%40er:p%3As'))
+        proxy.ticket.get(1)
+        headers = self.server.requests[0][0]
+        self.assertEqual(headers['authorization'],
+                         'Basic ' + base64.b64encode('us@er:p:s'))
+
+
+class DigestTest(unittest.TestCase):
+    def setUp(self):
+        self.server = server.TracServer(server.Dataset(10, 2),
+                                        digest=('bench', 'user', 'secret'))
+        self.port = self.server.start()
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def proxy(self, password='secret', realm='bench'):
+        self.transport = vitra.HTTPDigestTransport('http', 'user', password,
+                                                   realm)
+        return vitra.ServerProxy('http://127.0.0.1:{0}/login/rpc'.format(
+            self.port), self.transport)
+
+    def test_challenge_and_cookie_reused(self):
+        proxy = self.proxy()
+        for tid in (1, 2, 3):
+            self.assertEqual(proxy.ticket.get(tid)[0], tid)
+        counters = self.server.snapshot()
+        self.assertEqual(counters['challenge'], 1)
+        self.assertEqual(counters['digest'], 1)
+        self.assertEqual(counters['cookie'], 2)
+        self.assertEqual(counters['connections'], 1)
+        self.assertEqual(counters['requests'], 4)
+
+    def test_challenge_reused_without_cookie(self):
+        proxy = self.proxy()
+        for tid in (1, 2, 3):
+            self.transport.cookies.clear()
+            self.assertEqual(proxy.ticket.get(tid)[0], tid)
+        counters = self.server.snapshot()
+        self.assertEqual(counters['challenge'], 1)
+        self.assertEqual(counters['digest'], 3)
+        self.assertEqual(counters['connections'], 1)
+
+    def test_wrong_password(self):
+        proxy = self.proxy(password='wrong')
+        with self.assertRaises(xmlrpclib.ProtocolError) as cm:
+            proxy.ticket.get(1)
+        self.assertEqual(cm.exception.errcode, 401)
+        self.assertEqual(self.server.snapshot()['challenge'], 2)
+
+    def test_other_realm(self):
+        proxy = self.proxy(realm='other')
+        self.assertRaises(xmlrpclib.ProtocolError, proxy.ticket.get, 1)
+        self.assertEqual(self.server.snapshot()['requests'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()